@@ -11,5 +11,18 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = os.getenv('ENVIRONMENT')
     CLASSIFIER_MODEL_PATH: str = os.getenv('CLASSIFIER_MODEL_PATH')
     EXPLAINER_MODEL_HF: str = os.getenv('EXPLAINER_MODEL_HF')
+    MODEL_MEMORY_BUDGET_MB: int = int(os.getenv('MODEL_MEMORY_BUDGET_MB', 2048))
+    MODEL_IDLE_UNLOAD_SECONDS: int = int(os.getenv('MODEL_IDLE_UNLOAD_SECONDS', 900))
+    MODEL_IDLE_SWEEP_SECONDS: int = int(os.getenv('MODEL_IDLE_SWEEP_SECONDS', 30))
+    CLASSIFIER_MODEL_SIZE_HINT_MB: int = int(os.getenv('CLASSIFIER_MODEL_SIZE_HINT_MB', 50))
+    EXPLAINER_MODEL_SIZE_HINT_MB: int = int(os.getenv('EXPLAINER_MODEL_SIZE_HINT_MB', 1000))
+    CLASSIFIER_INFERENCE_WORKERS: int = int(os.getenv('CLASSIFIER_INFERENCE_WORKERS', 1))
+    CLASSIFIER_INFERENCE_THREADS: int = int(os.getenv('CLASSIFIER_INFERENCE_THREADS', 0))
+    EXPLAINER_INFERENCE_WORKERS: int = int(os.getenv('EXPLAINER_INFERENCE_WORKERS', 1))
+    EXPLAINER_INFERENCE_THREADS: int = int(os.getenv('EXPLAINER_INFERENCE_THREADS', 0))
+    INFERENCE_AUTOTUNE: bool = os.getenv('INFERENCE_AUTOTUNE', 'false').lower() == 'true'
+    INFERENCE_AUTOTUNE_EXPLAINER: bool = os.getenv('INFERENCE_AUTOTUNE_EXPLAINER', 'false').lower() == 'true'
+    EMBEDDING_INDEX_PATH: str = os.getenv('EMBEDDING_INDEX_PATH', './models/checkpoints/embedding_index.npz')
+    EMBEDDING_FAST_PATH_MAX_DISTANCE: float = float(os.getenv('EMBEDDING_FAST_PATH_MAX_DISTANCE', 0.02))
 
 settings = Settings()
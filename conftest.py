@@ -0,0 +1 @@
+# Puts the repository root on sys.path, so the tests import `models` and `src` like the API does.
@@ -1,12 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
 from config import settings
+from src.api.dependencies import autotune_inference_executors, shutdown_inference_executors
 from src.api.router import api_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.INFERENCE_AUTOTUNE:
+        await run_in_threadpool(autotune_inference_executors)
+    yield
+    shutdown_inference_executors()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_VERSION_PREFIX}/openapi.json",
-    docs_url="/docs"
+    docs_url="/docs",
+    lifespan=lifespan
 )
 
 app.add_middleware(
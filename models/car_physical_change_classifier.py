@@ -6,24 +6,27 @@ from PIL import Image
 from torchvision import transforms, models
 
 from config import settings
+from models.embedding_index import weights_fingerprint
+from models.model_manager import module_resident_bytes
 
 
 class CarPhysicalChangeClassifier:
+    # Class attributes, readable without an instance or a loaded model.
+    IMG_HEIGHT = 320
+    IMG_WIDTH = 320
+    NUM_COMPONENTS = 5
+    COMPONENT_NAMES = [
+        "front_left",
+        "front_right",
+        "rear_left",
+        "rear_right",
+        "hood"
+    ]
+
     def __init__(self, model_path = None):
         self.MODEL_WEIGHTS_PATH = model_path or settings.CLASSIFIER_MODEL_PATH
 
-        self.IMG_HEIGHT = 320
-        self.IMG_WIDTH = 320
-        self.NUM_COMPONENTS = 5
-        self.COMPONENT_NAMES = [
-            "front_left",
-            "front_right",
-            "rear_left",
-            "rear_right",
-            "hood"
-        ]
-
-        if not os.path.exists(self.MODEL_WEIGHTS_PATH):
+        if not self.MODEL_WEIGHTS_PATH or not os.path.exists(self.MODEL_WEIGHTS_PATH):
             raise Exception(f"ERROR: Model weights not found at {self.MODEL_WEIGHTS_PATH}")
 
 
@@ -31,6 +34,7 @@ class CarPhysicalChangeClassifier:
         print(f"Using device: {self.device}")
 
         self.inference_model = None
+        self.weights_fingerprint = None
 
         self.eval_transforms = transforms.Compose([
             transforms.Resize((self.IMG_HEIGHT, self.IMG_WIDTH)),
@@ -50,17 +54,34 @@ class CarPhysicalChangeClassifier:
 
         if os.path.exists(self.MODEL_WEIGHTS_PATH):
             try:
-                inference_model.load_state_dict(torch.load(self.MODEL_WEIGHTS_PATH, map_location=self.device))
+                # mmap the checkpoint so reloading after an eviction only pages in the weights
+                # instead of copying the whole file into memory first.
+                state_dict = torch.load(
+                    self.MODEL_WEIGHTS_PATH,
+                    map_location=self.device,
+                    mmap=True,
+                    weights_only=True
+                )
+                inference_model.load_state_dict(state_dict, assign=True)
                 print(f"Model weights loaded successfully from {self.MODEL_WEIGHTS_PATH}")
             except Exception as e:
                 raise Exception(f"Error loading model weights: {e}")
         else:
-            raise Exception(f"Error loading model weights: {e}")
+            raise Exception(f"Error loading model weights: not found at {self.MODEL_WEIGHTS_PATH}")
 
         self.inference_model = inference_model.to(self.device)
         self.inference_model.eval()
+        # Identifies the loaded weights, an embedding index built from other weights is not used.
+        self.weights_fingerprint = weights_fingerprint(self.MODEL_WEIGHTS_PATH)
         print("Model is in evaluation mode.")
 
+    def unload_model(self):
+        self.inference_model = None
+        self.weights_fingerprint = None
+
+    def resident_bytes(self):
+        return module_resident_bytes(self.inference_model)
+
 
     def preprocess_image(self, image_path):
         try:
@@ -82,26 +103,66 @@ class CarPhysicalChangeClassifier:
             raise ValueError(f"Invalid image file or error during preprocessing: {e}")
 
 
+    def predict_image_bytes(self, image_bytes: bytes):
+        return self.predict_image(self.preprocess_image_bytes(image_bytes))
+
     def predict_image(self, image_tensor):
         with torch.no_grad():
             image_tensor = image_tensor.to(self.device)
             outputs = self.inference_model(image_tensor)
+            return self._build_results(outputs)
+
+    def predict_frames(self, images):
+        """
+        Predicts a batch of PIL images in a single forward pass.
+
+        Returns:
+            numpy.ndarray: Open probabilities of shape (len(images), NUM_COMPONENTS).
+        """
+        try:
+            image_tensor = torch.stack([self.eval_transforms(image.convert('RGB')) for image in images])
+        except Exception as e:
+            raise ValueError(f"Invalid frame or error during preprocessing: {e}")
+
+        with torch.no_grad():
+            outputs = self.inference_model(image_tensor.to(self.device))
+            return torch.sigmoid(outputs.float()).cpu().numpy()
+
+    def extract_features(self, image_tensor):
+        """
+        Returns the penultimate EfficientNet features (pooled, before the classifier head)
+        as a float32 tensor of shape (batch, 1536).
+        """
+        with torch.no_grad():
+            image_tensor = image_tensor.to(self.device)
+            features = self.inference_model.features(image_tensor)
+            features = self.inference_model.avgpool(features)
+            return torch.flatten(features, 1).float()
+
+    def predict_features(self, features):
+        """
+        Runs only the classifier head on features returned by `extract_features`.
+        """
+        with torch.no_grad():
+            outputs = self.inference_model.classifier(features.to(self.device))
+            return self._build_results(outputs)
 
-            probabilities = torch.sigmoid(outputs)
+    def _build_results(self, outputs):
+        probabilities = torch.sigmoid(outputs.float())
 
-            predictions_binary = (probabilities > 0.5).float()
+        predictions_binary = (probabilities > 0.5).float()
 
-            predictions_binary_np = predictions_binary.cpu().numpy().squeeze()
-            probabilities_np = probabilities.cpu().numpy().squeeze()
+        predictions_binary_np = predictions_binary.cpu().numpy().squeeze()
+        probabilities_np = probabilities.cpu().numpy().squeeze()
 
-            results = {}
-            print("\n--- Predictions ---")
-            for i, name in enumerate(self.COMPONENT_NAMES):
-                state = "Open" if predictions_binary_np[i] == 1 else "Closed"
-                probability = probabilities_np[i]
-                results[name] = {'state': state, 'confidence_open': float(probability)}
-                print(f"{name}: {state} (Confidence for 'Open': {probability:.4f})")
-            return results
+        results = {}
+        print("\n--- Predictions ---")
+        for i, name in enumerate(self.COMPONENT_NAMES):
+            state = "Open" if predictions_binary_np[i] == 1 else "Closed"
+            probability = probabilities_np[i]
+            results[name] = {'state': state, 'confidence_open': float(probability)}
+            print(f"{name}: {state} (Confidence for 'Open': {probability:.4f})")
+        return results
 
 
 if __name__ == '__main__':
@@ -5,20 +5,33 @@ from transformers import BlipProcessor, BlipForConditionalGeneration
 import torch
 
 from config import settings
+from models.model_manager import module_resident_bytes
 
 
 class CarPhysicalChangeExplainer:
     def __init__(self):
         self.processor = None
         self.model = None
-        self.device = "cpu"
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     def load_model(self):
-        self.processor = BlipProcessor.from_pretrained(settings.EXPLAINER_MODEL_HF)
-        self.model = BlipForConditionalGeneration.from_pretrained(settings.EXPLAINER_MODEL_HF)
-
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if self.processor is None:
+            self.processor = BlipProcessor.from_pretrained(settings.EXPLAINER_MODEL_HF)
+
+        # safetensors checkpoints are memory mapped, low_cpu_mem_usage skips the random
+        # initialisation pass so a reload after an eviction does not double the peak memory.
+        self.model = BlipForConditionalGeneration.from_pretrained(
+            settings.EXPLAINER_MODEL_HF,
+            low_cpu_mem_usage=True
+        )
         self.model.to(self.device)
+        self.model.eval()
+
+    def unload_model(self):
+        self.model = None
+
+    def resident_bytes(self):
+        return module_resident_bytes(self.model)
 
     def preprocess_image_bytes(self, image_bytes: bytes):
         try:
@@ -34,4 +47,5 @@ class CarPhysicalChangeExplainer:
 
         return self.processor.decode(out[0], skip_special_tokens=True)
 
-
+    def completions_image_bytes(self, image_bytes: bytes):
+        return self.completions(self.preprocess_image_bytes(image_bytes))
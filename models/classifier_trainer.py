@@ -0,0 +1,498 @@
+import argparse
+import csv
+import math
+import os
+import random
+import time
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader, Sampler
+from torchvision import transforms, models
+
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CarComponentsDataset(Dataset):
+    """
+    Multi-label dataset read from the annotations CSV written by `DatasetsBuilder`.
+
+    Items are requested with `(index, sample_seed)` tuples. When a seed is given the random
+    augmentations of that sample are seeded with it, so the exact same batch can be rebuilt
+    after resuming, whatever the number of data loader workers.
+    """
+
+    def __init__(self, annotations, image_dir_path, transform=None):
+        self.annotations = annotations
+        self.image_dir_path = image_dir_path
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __getitem__(self, item):
+        index, sample_seed = item
+        filename, labels = self.annotations[index]
+
+        image = Image.open(os.path.join(self.image_dir_path, filename)).convert('RGB')
+
+        if self.transform:
+            if sample_seed is None:
+                image = self.transform(image)
+            else:
+                # Do not disturb the global RNG of the main process when num_workers=0.
+                with torch.random.fork_rng(devices=[]):
+                    torch.manual_seed(sample_seed)
+                    image = self.transform(image)
+
+        return image, torch.tensor(labels, dtype=torch.float32)
+
+
+class ResumableRandomSampler(Sampler):
+    """
+    Shuffles with a permutation derived from (seed, epoch) and can start in the middle of an epoch.
+    Yields `(index, sample_seed)` tuples for `CarComponentsDataset`.
+    """
+
+    def __init__(self, num_samples, seed=42, shuffle=True):
+        self.num_samples = num_samples
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+        self.start_index = 0
+
+    def set_epoch(self, epoch, start_index=0):
+        self.epoch = epoch
+        self.start_index = start_index
+
+    def __iter__(self):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.num_samples, generator=generator).tolist()
+        else:
+            order = list(range(self.num_samples))
+
+        for index in order[self.start_index:]:
+            if self.shuffle:
+                yield index, hash((self.seed, self.epoch, index)) & 0xFFFFFFFF
+            else:
+                yield index, None
+
+    def __len__(self):
+        return self.num_samples - self.start_index
+
+
+class ClassifierTrainer:
+    def __init__(self,
+                 csv_file_path=os.path.join(MODELS_DIR, 'datasets', 'annotations.csv'),
+                 image_dir_path=os.path.join(MODELS_DIR, 'datasets'),
+                 checkpoint_dir=os.path.join(MODELS_DIR, 'checkpoints'),
+                 num_epochs=100,
+                 batch_size=32,
+                 gradient_accumulation_steps=1,
+                 learning_rate=0.001,
+                 val_split=0.2,
+                 num_workers=2,
+                 prefetch_factor=4,
+                 channels_last=True,
+                 amp=True,
+                 checkpoint_every_steps=0,
+                 limit_batches=0,
+                 num_threads=0,
+                 seed=42
+                 ):
+        """
+        Initializes the ClassifierTrainer.
+
+        Args:
+            csv_file_path (str): Path to the annotations CSV.
+            image_dir_path (str): Directory containing the images listed in the CSV.
+            checkpoint_dir (str): Directory for the resumable and best checkpoints.
+            num_epochs (int): Number of epochs to train.
+            batch_size (int): Number of images per forward pass.
+            gradient_accumulation_steps (int): Number of batches accumulated per optimizer step.
+            learning_rate (float): Initial AdamW learning rate.
+            val_split (float): Fraction of the dataset held out for evaluation.
+            num_workers (int): Number of data loader worker processes.
+            prefetch_factor (int): Number of batches prefetched by each worker.
+            channels_last (bool): Use the channels_last memory format for the model and inputs.
+            amp (bool): Use mixed precision autocast (bf16 on CPU, fp16 on CUDA).
+            checkpoint_every_steps (int): Also save a resumable checkpoint every N optimizer steps, 0 disables it.
+            limit_batches (int): Only run the first N batches of each epoch, 0 disables it. Useful for benchmarks,
+                                 the best weights are not saved when it is set.
+            num_threads (int): Number of intra-op threads used by torch, 0 keeps the torch default.
+            seed (int): Seed for the split, the shuffling, the augmentations and the weight initialisation.
+        """
+        self.IMG_HEIGHT = 320
+        self.IMG_WIDTH = 320
+
+        self.csv_file_path = csv_file_path
+        self.image_dir_path = image_dir_path
+        self.checkpoint_dir = checkpoint_dir
+        self.last_checkpoint_path = os.path.join(checkpoint_dir, 'efficientnet_b3_multilabel_last.pth')
+        self.best_weights_path = os.path.join(checkpoint_dir, 'efficientnet_b3_multilabel_best.pth')
+
+        self.num_epochs = num_epochs
+        self.batch_size = batch_size
+        self.gradient_accumulation_steps = max(1, gradient_accumulation_steps)
+        self.learning_rate = learning_rate
+        self.val_split = val_split
+        self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.channels_last = channels_last
+        self.checkpoint_every_steps = checkpoint_every_steps
+        self.limit_batches = limit_batches
+        self.seed = seed
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        torch.manual_seed(seed)
+        random.seed(seed)
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        print(f"Using device: {self.device} ({torch.get_num_threads()} intra-op threads)")
+
+        self.amp = amp
+        self.amp_dtype = torch.float16 if self.device.type == 'cuda' else torch.bfloat16
+        # Loss scaling is only needed for fp16, bf16 has the same exponent range as fp32.
+        self.scaler = torch.amp.GradScaler(self.device.type, enabled=amp and self.amp_dtype == torch.float16)
+
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+
+        self.train_transforms = transforms.Compose([
+            transforms.Resize((self.IMG_HEIGHT, self.IMG_WIDTH)),
+            transforms.RandomHorizontalFlip(p=0.5),
+            transforms.RandomRotation(degrees=15),
+            transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+        self.eval_transforms = transforms.Compose([
+            transforms.Resize((self.IMG_HEIGHT, self.IMG_WIDTH)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+
+        self.component_names = []
+        self.train_loader = None
+        self.eval_loader = None
+        self.train_sampler = None
+
+        self.model = None
+        self.criterion = nn.BCEWithLogitsLoss()
+        self.optimizer = None
+        self.scheduler = None
+
+        self.epoch = 0
+        self.batch_in_epoch = 0
+        self.global_step = 0
+        self.best_eval_loss = float('inf')
+        self.history = {'train_loss': [], 'train_acc': [], 'eval_loss': [], 'eval_acc': [], 'train_images_per_sec': []}
+        self.epoch_accumulators = None
+
+    def _read_annotations(self):
+        annotations = []
+        with open(self.csv_file_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            self.component_names = header[1:]
+            for row in reader:
+                annotations.append((row[0].strip(), [float(value) for value in row[1:]]))
+        return annotations
+
+    def build_data_loaders(self):
+        annotations = self._read_annotations()
+
+        # Seeded split, so a resumed run evaluates on the same held-out images.
+        generator = torch.Generator()
+        generator.manual_seed(self.seed)
+        order = torch.randperm(len(annotations), generator=generator).tolist()
+        eval_len = int(self.val_split * len(annotations))
+        eval_annotations = [annotations[i] for i in order[:eval_len]]
+        train_annotations = [annotations[i] for i in order[eval_len:]]
+
+        print(f"Total dataset size: {len(annotations)}")
+        print(f"Training set size: {len(train_annotations)}")
+        print(f"Evaluation set size: {len(eval_annotations)}")
+        print(f"Using labels from columns: {self.component_names}")
+
+        train_dataset = CarComponentsDataset(train_annotations, self.image_dir_path, self.train_transforms)
+        eval_dataset = CarComponentsDataset(eval_annotations, self.image_dir_path, self.eval_transforms)
+
+        self.train_sampler = ResumableRandomSampler(len(train_dataset), seed=self.seed, shuffle=True)
+        eval_sampler = ResumableRandomSampler(len(eval_dataset), seed=self.seed, shuffle=False)
+
+        loader_kwargs = {
+            'batch_size': self.batch_size,
+            'num_workers': self.num_workers,
+            'pin_memory': self.device.type == 'cuda',
+        }
+        if self.num_workers > 0:
+            loader_kwargs['persistent_workers'] = True
+            loader_kwargs['prefetch_factor'] = self.prefetch_factor
+
+        self.train_loader = DataLoader(train_dataset, sampler=self.train_sampler, **loader_kwargs)
+        self.eval_loader = DataLoader(eval_dataset, sampler=eval_sampler, **loader_kwargs)
+        print("DataLoaders created.")
+
+    def build_model(self):
+        model = models.efficientnet_b3(weights=None)
+
+        features_number = model.classifier[1].in_features
+        model.classifier[1] = nn.Linear(features_number, len(self.component_names))
+
+        self.model = model.to(self.device, memory_format=self.memory_format)
+        self.optimizer = optim.AdamW(self.model.parameters(), lr=self.learning_rate, weight_decay=0.01)
+        self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(self.optimizer, mode='min', factor=0.1, patience=3)
+
+    def _new_accumulators(self):
+        # Metrics stay on the device and are only read once per epoch, avoiding a sync per step.
+        return {
+            'loss_sum': torch.zeros((), device=self.device),
+            'correct': torch.zeros((), dtype=torch.long, device=self.device),
+            'images': 0,
+            'elapsed': 0.0,
+        }
+
+    def _autocast(self):
+        return torch.autocast(device_type=self.device.type, dtype=self.amp_dtype, enabled=self.amp)
+
+    def _num_batches(self, loader_length):
+        if self.limit_batches:
+            return min(self.limit_batches, loader_length)
+        return loader_length
+
+    def train_one_epoch(self):
+        self.model.train()
+
+        num_batches = self._num_batches(math.ceil(self.train_sampler.num_samples / self.batch_size))
+        start_batch = self.batch_in_epoch
+        self.train_sampler.set_epoch(self.epoch, start_batch * self.batch_size)
+
+        accumulators = self.epoch_accumulators or self._new_accumulators()
+        self.epoch_accumulators = accumulators
+
+        start_time = time.perf_counter()
+        for batch_idx, (inputs, labels) in enumerate(self.train_loader, start=start_batch):
+            if batch_idx >= num_batches:
+                break
+
+            inputs = inputs.to(self.device, non_blocking=True, memory_format=self.memory_format)
+            labels = labels.to(self.device, non_blocking=True)
+
+            with self._autocast():
+                outputs = self.model(inputs)
+            loss = self.criterion(outputs.float(), labels)
+
+            self.scaler.scale(loss / self.gradient_accumulation_steps).backward()
+
+            accumulators['loss_sum'] += loss.detach() * inputs.size(0)
+            accumulators['correct'] += ((outputs.detach() > 0) == labels.bool()).sum()
+            accumulators['images'] += inputs.size(0)
+
+            is_last_batch = batch_idx + 1 == num_batches
+            if (batch_idx + 1) % self.gradient_accumulation_steps == 0 or is_last_batch:
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+                self.optimizer.zero_grad(set_to_none=True)
+                self.global_step += 1
+                self.batch_in_epoch = batch_idx + 1
+
+                if self.checkpoint_every_steps and self.global_step % self.checkpoint_every_steps == 0 \
+                        and not is_last_batch:
+                    accumulators['elapsed'] += time.perf_counter() - start_time
+                    start_time = time.perf_counter()
+                    self.save_checkpoint()
+
+        epoch_loss = accumulators['loss_sum'].item() / max(1, accumulators['images'])
+        elapsed = accumulators['elapsed'] + time.perf_counter() - start_time
+        epoch_acc = 100.0 * accumulators['correct'].item() / max(1, accumulators['images'] * len(self.component_names))
+        images_per_sec = accumulators['images'] / elapsed if elapsed > 0 else 0.0
+
+        self.epoch_accumulators = None
+        self.batch_in_epoch = 0
+        return epoch_loss, epoch_acc, images_per_sec, elapsed
+
+    def evaluate_model(self):
+        self.model.eval()
+        accumulators = self._new_accumulators()
+        num_batches = self._num_batches(len(self.eval_loader))
+
+        with torch.no_grad():
+            for batch_idx, (inputs, labels) in enumerate(self.eval_loader):
+                if batch_idx >= num_batches:
+                    break
+
+                inputs = inputs.to(self.device, non_blocking=True, memory_format=self.memory_format)
+                labels = labels.to(self.device, non_blocking=True)
+
+                with self._autocast():
+                    outputs = self.model(inputs)
+                loss = self.criterion(outputs.float(), labels)
+
+                accumulators['loss_sum'] += loss * inputs.size(0)
+                accumulators['correct'] += ((outputs > 0) == labels.bool()).sum()
+                accumulators['images'] += inputs.size(0)
+
+        epoch_loss = accumulators['loss_sum'].item() / max(1, accumulators['images'])
+        epoch_acc = 100.0 * accumulators['correct'].item() / max(1, accumulators['images'] * len(self.component_names))
+        return epoch_loss, epoch_acc
+
+    def _atomic_save(self, obj, path):
+        tmp_path = f"{path}.tmp"
+        torch.save(obj, tmp_path)
+        os.replace(tmp_path, path)
+
+    def save_checkpoint(self):
+        """
+        Saves everything needed to resume training at the current optimizer step.
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+        epoch_accumulators = None
+        if self.epoch_accumulators is not None:
+            epoch_accumulators = dict(self.epoch_accumulators)
+
+        checkpoint = {
+            'model': self.model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'scheduler': self.scheduler.state_dict(),
+            'scaler': self.scaler.state_dict(),
+            'epoch': self.epoch,
+            'batch_in_epoch': self.batch_in_epoch,
+            'global_step': self.global_step,
+            'best_eval_loss': self.best_eval_loss,
+            'history': self.history,
+            'epoch_accumulators': epoch_accumulators,
+            'torch_rng_state': torch.get_rng_state(),
+            'cuda_rng_state': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+            'python_rng_state': random.getstate(),
+        }
+        self._atomic_save(checkpoint, self.last_checkpoint_path)
+        print(f"Saved checkpoint at epoch {self.epoch + 1}, batch {self.batch_in_epoch} "
+              f"(step {self.global_step}) to {self.last_checkpoint_path}")
+
+    def load_checkpoint(self, checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+
+        self.model.load_state_dict(checkpoint['model'])
+        self.optimizer.load_state_dict(checkpoint['optimizer'])
+        self.scheduler.load_state_dict(checkpoint['scheduler'])
+        self.scaler.load_state_dict(checkpoint['scaler'])
+
+        self.epoch = checkpoint['epoch']
+        self.batch_in_epoch = checkpoint['batch_in_epoch']
+        self.global_step = checkpoint['global_step']
+        self.best_eval_loss = checkpoint['best_eval_loss']
+        self.history = checkpoint['history']
+        self.epoch_accumulators = checkpoint['epoch_accumulators']
+
+        torch.set_rng_state(checkpoint['torch_rng_state'].cpu())
+        if checkpoint['cuda_rng_state'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all([state.cpu() for state in checkpoint['cuda_rng_state']])
+        random.setstate(checkpoint['python_rng_state'])
+
+        print(f"Resumed from {checkpoint_path} at epoch {self.epoch + 1}, batch {self.batch_in_epoch} "
+              f"(step {self.global_step})")
+
+    def save_best_weights(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # Plain contiguous state dict, loadable by CarPhysicalChangeClassifier.
+        state_dict = {name: tensor.contiguous() for name, tensor in self.model.state_dict().items()}
+        self._atomic_save(state_dict, self.best_weights_path)
+
+    def run(self, resume_from=None):
+        self.build_data_loaders()
+        self.build_model()
+
+        if resume_from:
+            self.load_checkpoint(resume_from)
+
+        print(f"\nStarting Training using EfficientNet-B3 (Random Weights) on {self.device}")
+        print(f"Batch size: {self.batch_size} x {self.gradient_accumulation_steps} accumulation steps, "
+              f"workers: {self.num_workers}, channels_last: {self.channels_last}, "
+              f"amp: {self.amp} ({self.amp_dtype if self.amp else torch.float32})")
+
+        while self.epoch < self.num_epochs:
+            print(f"\n--- Epoch {self.epoch + 1}/{self.num_epochs} ---")
+            train_loss, train_acc, images_per_sec, elapsed = self.train_one_epoch()
+            print(f"Train Loss: {train_loss:.4f}, Train Component Acc: {train_acc:.2f}%")
+            print(f"Train Throughput: {images_per_sec:.1f} images/s ({elapsed:.1f}s)")
+
+            eval_loss, eval_acc = self.evaluate_model()
+            print(f"Eval Loss: {eval_loss:.4f}, Eval Component Acc: {eval_acc:.2f}%")
+
+            self.history['train_loss'].append(train_loss)
+            self.history['train_acc'].append(train_acc)
+            self.history['eval_loss'].append(eval_loss)
+            self.history['eval_acc'].append(eval_acc)
+            self.history['train_images_per_sec'].append(images_per_sec)
+
+            self.scheduler.step(eval_loss)
+
+            if eval_loss < self.best_eval_loss:
+                self.best_eval_loss = eval_loss
+                # Benchmark runs only see part of the data, they must not replace the served weights.
+                if self.limit_batches:
+                    print(f"Best eval loss at epoch {self.epoch + 1} ({self.best_eval_loss:.4f}), "
+                          f"weights not saved with --limit-batches")
+                else:
+                    self.save_best_weights()
+                    print(f"Saved best model weights at epoch {self.epoch + 1} (Eval Loss: {self.best_eval_loss:.4f})")
+
+            self.epoch += 1
+            self.save_checkpoint()
+
+        print("\n--- Training Finished ---")
+        return self.history
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the EfficientNet-B3 car state components classifier.")
+    parser.add_argument('--csv-file-path', default=os.path.join(MODELS_DIR, 'datasets', 'annotations.csv'))
+    parser.add_argument('--image-dir-path', default=os.path.join(MODELS_DIR, 'datasets'))
+    parser.add_argument('--checkpoint-dir', default=os.path.join(MODELS_DIR, 'checkpoints'))
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--gradient-accumulation-steps', type=int, default=1)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--val-split', type=float, default=0.2)
+    parser.add_argument('--num-workers', type=int, default=2)
+    parser.add_argument('--prefetch-factor', type=int, default=4)
+    parser.add_argument('--channels-last', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--amp', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--checkpoint-every-steps', type=int, default=0)
+    parser.add_argument('--limit-batches', type=int, default=0)
+    parser.add_argument('--num-threads', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--resume', default=None, help="Path to a *_last.pth checkpoint to resume from.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    trainer = ClassifierTrainer(
+        csv_file_path=args.csv_file_path,
+        image_dir_path=args.image_dir_path,
+        checkpoint_dir=args.checkpoint_dir,
+        num_epochs=args.epochs,
+        batch_size=args.batch_size,
+        gradient_accumulation_steps=args.gradient_accumulation_steps,
+        learning_rate=args.learning_rate,
+        val_split=args.val_split,
+        num_workers=args.num_workers,
+        prefetch_factor=args.prefetch_factor,
+        channels_last=args.channels_last,
+        amp=args.amp,
+        checkpoint_every_steps=args.checkpoint_every_steps,
+        limit_batches=args.limit_batches,
+        num_threads=args.num_threads,
+        seed=args.seed
+    )
+    trainer.run(resume_from=args.resume)
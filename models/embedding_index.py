@@ -0,0 +1,241 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+def parse_capture_filename(filename):
+    """
+    Extracts the camera view and tilt from a `DatasetsBuilder` filename, e.g.
+    'view_front_front_left_closed_..._hood_opened_7.png' -> ('view_front', 7).
+
+    Returns:
+        tuple: (view, tilt), (None, None) for filenames not produced by `DatasetsBuilder`.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if '_front_left_' not in stem:
+        return None, None
+
+    view = stem[:stem.index('_front_left_')]
+    tilt = stem.rsplit('_', 1)[-1]
+    return view, int(tilt) if tilt.isdigit() else None
+
+
+# sha1 by (path, st_mtime_ns, st_size), a reload after an idle eviction does not read the whole file again.
+_weights_fingerprints = {}
+
+
+def weights_fingerprint(path):
+    """
+    Returns the sha1 of a weights file, recorded in the index to detect it was built from other weights.
+    The digest is only computed again when the size or modification time of the file changed.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    fingerprint = _weights_fingerprints.get(key)
+    if fingerprint is None:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        fingerprint = digest.hexdigest()
+        _weights_fingerprints[key] = fingerprint
+    return fingerprint
+
+
+class StaleEmbeddingIndex(Exception):
+    """
+    Raised when the index was not built from the classifier weights currently loaded.
+    """
+
+
+class EmbeddingIndex:
+    """
+    Nearest-neighbour index over the penultimate classifier features of the reference frames.
+
+    Features are optionally reduced with a PCA projection and L2 normalised, so the cosine
+    distance of a query to every reference is a single matrix-vector product followed by an
+    `argpartition` top-k. On disk the matrix is stored as float16, or int8 with a per-row scale
+    when quantized; it is expanded to float32 once at load time because numpy has no BLAS
+    kernel for float16 and would be orders of magnitude slower.
+
+    The features only make sense for the classifier weights that produced them, so the index
+    records the `weights_fingerprint` of the checkpoint and is not used with other weights.
+    """
+
+    def __init__(self, embeddings, labels, filenames, views, tilts, component_names, mean=None, projection=None,
+                 weights_fingerprint=None):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.uint8)
+        self.filenames = np.asarray(filenames)
+        self.views = np.asarray(views)
+        self.tilts = np.asarray(tilts, dtype=np.int16)
+        self.component_names = [str(name) for name in component_names]
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.projection = None if projection is None else np.ascontiguousarray(projection, dtype=np.float32)
+        self.weights_fingerprint = weights_fingerprint
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+
+        embeddings = data['embeddings'].astype(np.float32)
+        if 'scales' in data.files:
+            embeddings *= data['scales'][:, None] / 127.0
+
+        return cls(
+            embeddings=embeddings,
+            labels=data['labels'],
+            filenames=data['filenames'],
+            views=data['views'],
+            tilts=data['tilts'],
+            component_names=data['component_names'],
+            mean=data['mean'] if 'mean' in data.files else None,
+            projection=data['projection'] if 'projection' in data.files else None,
+            weights_fingerprint=str(data['weights_fingerprint']) if 'weights_fingerprint' in data.files else None
+        )
+
+    def save(self, path, quantize=False):
+        """
+        Args:
+            path (str): Output `.npz` path.
+            quantize (bool): Store the matrix as int8 with a per-row scale instead of float16.
+        """
+        arrays = {
+            'labels': self.labels,
+            'filenames': self.filenames,
+            'views': self.views,
+            'tilts': self.tilts,
+            'component_names': np.asarray(self.component_names),
+        }
+        if quantize:
+            scales = np.abs(self.embeddings).max(axis=1)
+            scales[scales == 0] = 1.0
+            arrays['embeddings'] = np.round(self.embeddings / scales[:, None] * 127.0).astype(np.int8)
+            arrays['scales'] = scales.astype(np.float32)
+        else:
+            arrays['embeddings'] = self.embeddings.astype(np.float16)
+
+        if self.mean is not None:
+            arrays['mean'] = self.mean
+        if self.projection is not None:
+            arrays['projection'] = self.projection
+        if self.weights_fingerprint is not None:
+            arrays['weights_fingerprint'] = np.asarray(self.weights_fingerprint)
+
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        np.savez(path, **arrays)
+
+    def matches(self, model):
+        """
+        Returns whether the index was built from the weights loaded by `model`. Indexes
+        without a fingerprint predate it and are considered stale.
+        """
+        return self.weights_fingerprint is not None and self.weights_fingerprint == model.weights_fingerprint
+
+    def project(self, features):
+        """
+        Maps raw classifier features of shape (n, features) to normalised index vectors.
+        """
+        vectors = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+        if self.mean is not None:
+            vectors = vectors - self.mean
+        if self.projection is not None:
+            vectors = vectors @ self.projection
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def search(self, features, k=5):
+        """
+        Returns the `k` reference frames closest to a single feature vector.
+
+        Returns:
+            list: Neighbour dictionaries sorted by increasing cosine distance.
+        """
+        query = self.project(np.asarray(features).reshape(1, -1))[0]
+        scores = self.embeddings @ query
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+
+        return [self.neighbor(index, 1.0 - float(scores[index])) for index in top_indices]
+
+    def neighbor(self, index, distance):
+        view = str(self.views[index])
+        tilt = int(self.tilts[index])
+        return {
+            'filename': str(self.filenames[index]),
+            'distance': distance,
+            'view': view or None,
+            'tilt': tilt if tilt >= 0 else None,
+            'labels': {
+                name: "Open" if self.labels[index][i] else "Closed"
+                for i, name in enumerate(self.component_names)
+            },
+        }
+
+    def predictions_from_neighbor(self, neighbor):
+        """
+        Formats the labels of a neighbour like `CarPhysicalChangeClassifier.predict_image`.
+        The reference frames only have hard labels, so the cosine similarity of the match
+        stands in for the confidence: `confidence_open` is the similarity for an open component
+        and `1 - similarity` for a closed one.
+        """
+        similarity = min(1.0, max(0.0, 1.0 - neighbor['distance']))
+        return {
+            name: {'state': state, 'confidence_open': similarity if state == "Open" else 1.0 - similarity}
+            for name, state in neighbor['labels'].items()
+        }
+
+    def annotation_row_from_neighbor(self, neighbor):
+        """
+        Formats the labels of a neighbour like a row of the annotations CSV.
+        """
+        row = {'filename': neighbor['filename']}
+        for name, state in neighbor['labels'].items():
+            row[name] = '1' if state == "Open" else '0'
+        return row
+
+
+def search_image_bytes(model, image_bytes, embedding_index, k=5):
+    """
+    Returns the `k` reference frames closest to an image. Runs on the classifier executor.
+
+    Raises:
+        StaleEmbeddingIndex: When the index was built from other classifier weights.
+    """
+    if not embedding_index.matches(model):
+        raise StaleEmbeddingIndex("Embedding index was built from other classifier weights, rebuild it.")
+
+    features = model.extract_features(model.preprocess_image_bytes(image_bytes))
+    return embedding_index.search(features.cpu().numpy()[0], k)
+
+
+def predict_image_bytes_with_index(model, image_bytes, embedding_index, max_distance):
+    """
+    Answers from the closest reference frame when it is within `max_distance`, otherwise runs
+    the classifier head on the features already computed for the lookup. The index is skipped
+    when it was built from other classifier weights. Runs on the classifier executor.
+
+    Returns:
+        tuple: (predictions, source) where source is 'index' or 'model'.
+    """
+    features = model.extract_features(model.preprocess_image_bytes(image_bytes))
+    if not embedding_index.matches(model):
+        return model.predict_features(features), 'model'
+
+    neighbors = embedding_index.search(features.cpu().numpy()[0], k=1)
+    if neighbors and neighbors[0]['distance'] <= max_distance:
+        return embedding_index.predictions_from_neighbor(neighbors[0]), 'index'
+
+    return model.predict_features(features), 'model'
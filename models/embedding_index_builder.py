@@ -0,0 +1,150 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import torch
+
+from config import settings
+from models.car_physical_change_classifier import CarPhysicalChangeClassifier
+from models.embedding_index import EmbeddingIndex, parse_capture_filename, weights_fingerprint
+
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class EmbeddingIndexBuilder:
+    def __init__(self,
+                 source_path=os.path.join(MODELS_DIR, 'datasets', 'annotations.csv'),
+                 image_dir_path=os.path.join(MODELS_DIR, 'datasets'),
+                 output_path=None,
+                 model_path=None,
+                 dim=128,
+                 quantize=False,
+                 batch_size=32
+                 ):
+        """
+        Initializes the EmbeddingIndexBuilder.
+
+        Args:
+            source_path (str): Path to the annotations CSV of the reference frames.
+            image_dir_path (str): Directory containing the images listed in the CSV.
+            output_path (str): Path of the `.npz` index. Defaults to `settings.EMBEDDING_INDEX_PATH`.
+            model_path (str): Classifier weights. Defaults to `settings.CLASSIFIER_MODEL_PATH`.
+            dim (int): Number of PCA components kept, 0 keeps the raw classifier features.
+            quantize (bool): Store the index as int8 instead of float16.
+            batch_size (int): Number of images per forward pass.
+        """
+        self.csv_annotations_source_path = source_path
+        self.image_dir_path = image_dir_path
+        self.output_path = output_path or settings.EMBEDDING_INDEX_PATH
+        self.model_path = model_path
+        self.dim = dim
+        self.quantize = quantize
+        self.batch_size = batch_size
+
+    def _read_annotations(self):
+        with open(self.csv_annotations_source_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            rows = [(row[0].strip(), [int(value) for value in row[1:]]) for row in reader]
+        return header[1:], rows
+
+    def _extract_features(self, model, rows):
+        """
+        Returns:
+            tuple: (features, kept_rows) without the rows whose image could not be read.
+        """
+        features = []
+        kept_rows = []
+        for start in range(0, len(rows), self.batch_size):
+            batch_rows = []
+            batch_tensors = []
+            for filename, labels in rows[start:start + self.batch_size]:
+                image_tensor = model.preprocess_image(os.path.join(self.image_dir_path, filename))
+                if image_tensor is not None:
+                    batch_rows.append((filename, labels))
+                    batch_tensors.append(image_tensor)
+
+            if batch_tensors:
+                features.append(model.extract_features(torch.cat(batch_tensors)).cpu().numpy())
+                kept_rows.extend(batch_rows)
+            print(f"Embedded {min(start + self.batch_size, len(rows))}/{len(rows)} images...")
+
+        return np.concatenate(features), kept_rows
+
+    def _fit_projection(self, features):
+        """
+        PCA through the eigendecomposition of the (features x features) covariance matrix,
+        cheaper than an SVD of the whole feature matrix.
+        """
+        mean = features.mean(axis=0)
+        centered = features - mean
+        covariance = centered.T @ centered / max(1, len(features) - 1)
+        _, eigenvectors = np.linalg.eigh(covariance)
+        projection = eigenvectors[:, ::-1][:, :self.dim]
+        return mean.astype(np.float32), np.ascontiguousarray(projection, dtype=np.float32)
+
+    def build(self):
+        print(f"Starting embedding index build...")
+        print(f"Source CSV: {self.csv_annotations_source_path}")
+        print(f"Output index: {self.output_path}")
+
+        model = CarPhysicalChangeClassifier(model_path=self.model_path)
+        model.load_model()
+
+        component_names, rows = self._read_annotations()
+        start_time = time.perf_counter()
+        features, rows = self._extract_features(model, rows)
+        print(f"Extracted {features.shape} features in {time.perf_counter() - start_time:.1f}s")
+
+        mean, projection = None, None
+        if self.dim and self.dim < features.shape[1]:
+            mean, projection = self._fit_projection(features)
+
+        views, tilts = [], []
+        for filename, _ in rows:
+            view, tilt = parse_capture_filename(filename)
+            views.append(view or '')
+            tilts.append(-1 if tilt is None else tilt)
+
+        index = EmbeddingIndex(
+            embeddings=np.zeros((0, 0)),
+            labels=[labels for _, labels in rows],
+            filenames=[filename for filename, _ in rows],
+            views=views,
+            tilts=tilts,
+            component_names=component_names,
+            mean=mean,
+            projection=projection,
+            weights_fingerprint=weights_fingerprint(model.MODEL_WEIGHTS_PATH)
+        )
+        index.embeddings = index.project(features)
+        index.save(self.output_path, quantize=self.quantize)
+
+        print(f"Successfully wrote {len(index)} x {index.embeddings.shape[1]} index to {self.output_path}")
+        return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the embedding index of the reference frames.")
+    parser.add_argument('--source-path', default=os.path.join(MODELS_DIR, 'datasets', 'annotations.csv'))
+    parser.add_argument('--image-dir-path', default=os.path.join(MODELS_DIR, 'datasets'))
+    parser.add_argument('--output-path', default=None)
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--quantize', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    embedding_index_builder = EmbeddingIndexBuilder(
+        source_path=args.source_path,
+        image_dir_path=args.image_dir_path,
+        output_path=args.output_path,
+        model_path=args.model_path,
+        dim=args.dim,
+        quantize=args.quantize,
+        batch_size=args.batch_size
+    )
+    embedding_index_builder.build()
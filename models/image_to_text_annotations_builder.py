@@ -1,106 +1,445 @@
+import argparse
 import csv
+import glob
+import hashlib
+import itertools
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+OUTPUT_FORMAT_CSV = 'csv'
+OUTPUT_FORMAT_PARQUET = 'parquet'
+
+DEFAULT_OUTPUT_PATHS = {
+    OUTPUT_FORMAT_CSV: 'datasets/image_to_text_annotations.csv',
+    OUTPUT_FORMAT_PARQUET: 'datasets/image_to_text_annotations',
+}
+
+
+def build_text_annotation(row):
+    """
+    Builds the caption of a single source row.
+
+    Args:
+        row (dict): Source CSV row with 'filename' and one 0/1 column per component.
+
+    Returns:
+        dict: A dictionary with 'filename' and 'text' keys.
+    """
+    filename = row.get('filename')
+
+    front_left_label = 'open' if row.get('front_left') == '1' else 'closed'
+    front_right_label = 'open' if row.get('front_right') == '1' else 'closed'
+    rear_left_label = 'open' if row.get('rear_left') == '1' else 'closed'
+    rear_right_label = 'open' if row.get('rear_right') == '1' else 'closed'
+    hood_label = 'open' if row.get('hood') == '1' else 'closed'
+
+    text_content = f"""
+                            The front left door is {front_left_label}, 
+                            the front right door is {front_right_label}, 
+                            the rear left door is {rear_left_label}, 
+                            the rear right door is {rear_right_label}, 
+                            and the hood is {hood_label}.
+                    """
+
+    return {'filename': filename.strip(), 'text': text_content.strip()}
+
+
+def build_text_annotations_chunk(rows):
+    """
+    Builds the captions of a chunk of source rows. Module level so it can run in a worker process.
+    """
+    return [build_text_annotation(row) for row in rows]
+
+
+def hash_source_row(row):
+    """
+    Returns a stable hash of all the values of a source row, used to detect changed rows.
+    """
+    content = '\x1f'.join(f"{key}={value}" for key, value in sorted(row.items()))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ManifestMismatch(Exception):
+    """
+    Raised when a row already present in the manifest changed in, or was removed from, the source CSV.
+    """
+
+
+class _CsvChunkWriter:
+    def __init__(self, path, fieldnames, append):
+        write_header = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, mode='a' if append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if write_header:
+            self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetChunkWriter:
+    def __init__(self, path, fieldnames):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("pyarrow is required to write Parquet annotations: pip install pyarrow") from e
+
+        self.pa = pa
+        self.fieldnames = fieldnames
+        schema = pa.schema([(name, pa.string()) for name in fieldnames])
+        self.writer = pq.ParquetWriter(path, schema)
+
+    def write_rows(self, rows):
+        columns = {name: [row[name] for row in rows] for name in self.fieldnames}
+        self.writer.write_table(self.pa.table(columns))
+
+    def close(self):
+        self.writer.close()
 
 
 class ImageToTextAnnotationsBuilder:
     def __init__(self,
                  source_path='datasets/annotations.csv',
-                 output_path='datasets/image_to_text_annotations.csv'
+                 output_path=None,
+                 manifest_path=None,
+                 output_format=OUTPUT_FORMAT_CSV,
+                 chunk_size=10000,
+                 num_workers=1
                  ):
         """
         Initializes the ImageToTextAnnotationsBuilder.
 
         Args:
             source_path (str): Path to the source CSV file.
-            output_path (str): Path where the processed CSV file will be saved.
+            output_path (str): Path where the processed CSV file will be saved. For the 'parquet'
+                               format this is a directory receiving one part file per build, a '.csv'
+                               path is replaced by the directory of the same name without extension.
+                               Defaults to `DEFAULT_OUTPUT_PATHS` of the output format.
+            manifest_path (str): Path of the manifest of already processed source rows.
+                                 Defaults to `output_path` + '.manifest.csv'.
+            output_format (str): Either 'csv' or 'parquet'.
+            chunk_size (int): Number of rows read, processed and written at once.
+            num_workers (int): Number of processes generating captions, 1 processes in the current process.
         """
+        if output_format not in (OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_PARQUET):
+            raise ValueError(f"Unsupported output format: {output_format}")
+
+        output_path = output_path or DEFAULT_OUTPUT_PATHS[output_format]
+        if output_format == OUTPUT_FORMAT_PARQUET:
+            if output_path.lower().endswith('.csv'):
+                output_path = output_path[:-len('.csv')]
+            if os.path.isfile(output_path):
+                raise ValueError(f"Parquet output path must be a directory, found a file at {output_path}")
+
         self.csv_annotations_source_path = source_path
         self.output_csv_path = output_path
+        self.manifest_path = manifest_path or f"{output_path.rstrip(os.sep)}.manifest.csv"
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers
         self.output_header = ['filename', 'text']
+        self.manifest_header = ['filename', 'row_hash']
+
+    def _read_source_chunks(self):
+        """
+        Streams the source CSV in chunks.
 
-    def _extract_and_process_data(self):
+        Yields:
+            list: Up to `chunk_size` source rows as dictionaries.
         """
-        Reads the source CSV, extracts relevant data, and processes it.
+        with open(self.csv_annotations_source_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
 
+    def _load_manifest(self):
+        """
         Returns:
-            list: A list of dictionaries, where each dictionary has 'filename' and 'text' keys.
-                  Returns an empty list if the source file is not found, crucial columns are
-                  missing in the header, or another error occurs.
+            tuple: (manifest, num_rows), the source row hash by filename for every row already
+                   written to the output and the number of output rows the manifest accounts for.
         """
-        processed_data = []
-        try:
-            with open(self.csv_annotations_source_path, mode='r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
+        manifest = {}
+        num_rows = 0
+        if not os.path.exists(self.manifest_path):
+            return manifest, num_rows
 
-                for i, row in enumerate(reader):
-                    print(row)
-                    filename = row.get('filename')
+        with open(self.manifest_path, mode='r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                manifest[row['filename']] = row['row_hash']
+                num_rows += 1
+        return manifest, num_rows
 
-                    front_left_label = 'open' if row.get('front_left') == '1' else 'closed'
-                    front_right_label = 'open' if row.get('front_right') == '1' else 'closed'
-                    rear_left_label = 'open' if row.get('rear_left') == '1' else 'closed'
-                    rear_right_label = 'open' if row.get('rear_right') == '1' else 'closed'
-                    hood_label = 'open' if row.get('hood') == '1' else 'closed'
+    def _pending_manifest_path(self, part_path):
+        return f"{self.manifest_path}.{os.path.basename(part_path)}.pending"
 
-                    text_content = f"""
-                            The front left door is {front_left_label}, 
-                            the front right door is {front_right_label}, 
-                            the rear left door is {rear_left_label}, 
-                            the rear right door is {rear_right_label}, 
-                            and the hood is {hood_label}.
-                    """
+    def _merge_pending_manifest(self, pending_manifest_path):
+        with open(pending_manifest_path, mode='r', newline='', encoding='utf-8') as file:
+            manifest_writer = _CsvChunkWriter(self.manifest_path, self.manifest_header, append=True)
+            manifest_writer.write_rows(csv.DictReader(file))
+            manifest_writer.close()
+        os.remove(pending_manifest_path)
+
+    def _recover_pending_manifests(self):
+        """
+        Completes the Parquet appends interrupted between the commit of their part file and the merge
+        of their manifest rows, and drops the manifest rows of the parts that were never committed.
+        """
+        for pending_manifest_path in glob.glob(f"{glob.escape(self.manifest_path)}.part-*.parquet.pending"):
+            part_name = pending_manifest_path[len(self.manifest_path) + 1:-len('.pending')]
+            if os.path.exists(os.path.join(self.output_csv_path, part_name)):
+                print(f"Recovering the manifest rows of {part_name}")
+                self._merge_pending_manifest(pending_manifest_path)
+            else:
+                os.remove(pending_manifest_path)
 
-                    processed_data.append({'filename': filename.strip(), 'text': text_content.strip()})
+    def _truncate_csv_output(self, num_rows):
+        """
+        Drops the CSV output rows past the first `num_rows`, written by an append interrupted
+        before their manifest rows.
 
-        except FileNotFoundError:
-            print(f"Error: Source CSV file not found at {self.csv_annotations_source_path}")
-            return []
-        except Exception as e:
-            print(f"An error occurred while reading or processing the source CSV: {e}")
-            return []
+        Raises:
+            ManifestMismatch: When the output has fewer rows than the manifest.
+        """
+        with open(self.output_csv_path, mode='r+', newline='', encoding='utf-8') as file:
+            # Records are read line by line, captions span several lines, so that `tell()`
+            # is the end of the last record read.
+            reader = csv.reader(iter(file.readline, ''))
+            records_read = sum(1 for _ in itertools.islice(reader, num_rows + 1))
+            if records_read < num_rows + 1:
+                raise ManifestMismatch(f"Output has {max(0, records_read - 1)} rows, the manifest lists {num_rows}")
+
+            end_offset = file.tell()
+            if file.readline():
+                file.truncate(end_offset)
+                print(f"Dropped the output rows of an interrupted append after row {num_rows}")
+
+    def _output_exists(self):
+        if self.output_format == OUTPUT_FORMAT_PARQUET:
+            return bool(glob.glob(os.path.join(self.output_csv_path, 'part-*.parquet')))
+        return os.path.exists(self.output_csv_path)
+
+    def _filter_new_rows(self, source_chunks, manifest):
+        """
+        Drops the rows already present in the manifest.
 
-        return processed_data
+        Yields:
+            tuple: (rows, row_hashes) for the new rows of each chunk, skipping empty chunks.
 
-    def _write_processed_csv(self, data_to_write):
+        Raises:
+            ManifestMismatch: When a row of the manifest has different values in the source, or once
+                              the whole source is read, when a row of the manifest is no longer in it.
         """
-        Writes the processed data to the output CSV file.
+        unseen_filenames = set(manifest)
+        for chunk in source_chunks:
+            new_rows = []
+            new_hashes = []
+            for row in chunk:
+                row_hash = hash_source_row(row)
+                filename = row.get('filename', '').strip()
+                unseen_filenames.discard(filename)
+                known_hash = manifest.get(filename)
+                if known_hash == row_hash:
+                    continue
+                if known_hash is not None:
+                    raise ManifestMismatch(f"Source row changed for {row.get('filename')}")
+                new_rows.append(row)
+                new_hashes.append(row_hash)
+
+            if new_rows:
+                yield new_rows, new_hashes
+
+        if unseen_filenames:
+            raise ManifestMismatch(f"{len(unseen_filenames)} source rows removed, "
+                                   f"e.g. {sorted(unseen_filenames)[0]}")
+
+    def _extract_and_process_data(self, pending_chunks):
+        """
+        Generates the captions of the pending chunks, in worker processes when `num_workers` > 1.
+        At most 2 chunks per worker are in flight, so memory stays bounded for any input size.
+
+        Yields:
+            tuple: (processed_rows, source_rows, row_hashes) in source order.
+        """
+        if self.num_workers <= 1:
+            for rows, row_hashes in pending_chunks:
+                yield build_text_annotations_chunk(rows), rows, row_hashes
+            return
+
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            in_flight = deque()
+            for rows, row_hashes in pending_chunks:
+                in_flight.append((executor.submit(build_text_annotations_chunk, rows), rows, row_hashes))
+                if len(in_flight) >= self.num_workers * 2:
+                    future, rows, row_hashes = in_flight.popleft()
+                    yield future.result(), rows, row_hashes
+
+            while in_flight:
+                future, rows, row_hashes = in_flight.popleft()
+                yield future.result(), rows, row_hashes
+
+    def _open_output_writer(self, append):
+        if self.output_format == OUTPUT_FORMAT_PARQUET:
+            os.makedirs(self.output_csv_path, exist_ok=True)
+            part_index = len(glob.glob(os.path.join(self.output_csv_path, 'part-*.parquet'))) if append else 0
+            part_path = os.path.join(self.output_csv_path, f"part-{part_index:05d}.parquet")
+            return _ParquetChunkWriter(f"{part_path}.tmp", self.output_header), part_path
+
+        if append:
+            return _CsvChunkWriter(self.output_csv_path, self.output_header, append=True), self.output_csv_path
+        return _CsvChunkWriter(f"{self.output_csv_path}.tmp", self.output_header, append=False), self.output_csv_path
+
+    def _write_processed_csv(self, processed_chunks, append):
+        """
+        Writes the processed chunks to the output and records their rows in the manifest.
 
         Args:
-            data_to_write (list): A list of dictionaries to write to the CSV.
-                                  Each dictionary should have 'filename' and 'text' keys.
+            processed_chunks (iterable): (processed_rows, source_rows, row_hashes) tuples.
+            append (bool): Append to the existing output and manifest instead of replacing them.
+
+        Returns:
+            int: Number of rows written.
         """
+        output_dir = os.path.dirname(self.output_csv_path.rstrip(os.sep))
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+            print(f"Created output directory: {output_dir}")
+
+        writer, output_target = self._open_output_writer(append)
+        if not append:
+            manifest_target = f"{self.manifest_path}.tmp"
+        elif self.output_format == OUTPUT_FORMAT_PARQUET:
+            # Parquet rows only exist once their part file is committed, so their manifest rows
+            # are kept aside until then, see `_recover_pending_manifests`.
+            manifest_target = self._pending_manifest_path(output_target)
+        else:
+            manifest_target = self.manifest_path
+        manifest_writer = _CsvChunkWriter(
+            manifest_target,
+            self.manifest_header,
+            append=manifest_target == self.manifest_path
+        )
+
+        rows_written = 0
         try:
-            # Ensure output directory exists
-            output_dir = os.path.dirname(self.output_csv_path)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-                print(f"Created output directory: {output_dir}")
-
-            with open(self.output_csv_path, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=self.output_header)
-                writer.writeheader()
-                writer.writerows(data_to_write)
-            print(f"Successfully wrote processed data to {self.output_csv_path}")
-        except IOError as e:
-            print(
-                f"Error: Could not write to output CSV file at {self.output_csv_path}. Check permissions or path. Details: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred during CSV writing: {e}")
-
-    def build(self):
-        """
-        Orchestrates the reading of the source CSV, processing the data,
-        and writing it to a new CSV file.
+            for processed_rows, source_rows, row_hashes in processed_chunks:
+                writer.write_rows(processed_rows)
+                # The manifest is written after the output. A CSV append interrupted in between
+                # leaves output rows without manifest rows, the next build truncates them.
+                manifest_writer.write_rows([
+                    {'filename': row['filename'], 'row_hash': row_hash}
+                    for row, row_hash in zip(processed_rows, row_hashes)
+                ])
+                rows_written += len(processed_rows)
+                print(f"Wrote {rows_written} rows...")
+        except BaseException:
+            writer.close()
+            manifest_writer.close()
+            # Drop the uncommitted files, the rows appended to a CSV output are covered by the manifest.
+            uncommitted_paths = [f"{output_target}.tmp", f"{self.manifest_path}.tmp"]
+            if manifest_target != self.manifest_path:
+                uncommitted_paths.append(manifest_target)
+            for uncommitted_path in uncommitted_paths:
+                if os.path.exists(uncommitted_path):
+                    os.remove(uncommitted_path)
+            raise
+
+        writer.close()
+        manifest_writer.close()
+
+        if self.output_format == OUTPUT_FORMAT_PARQUET:
+            if rows_written == 0:
+                os.remove(f"{output_target}.tmp")
+                if append:
+                    os.remove(manifest_target)
+            else:
+                if not append:
+                    for old_part_path in glob.glob(os.path.join(self.output_csv_path, 'part-*.parquet')):
+                        os.remove(old_part_path)
+                os.replace(f"{output_target}.tmp", output_target)
+                if append:
+                    self._merge_pending_manifest(manifest_target)
+        elif not append:
+            os.replace(f"{output_target}.tmp", output_target)
+
+        if not append:
+            os.replace(manifest_target, self.manifest_path)
+
+        return rows_written
+
+    def build(self, full_rebuild=False):
+        """
+        Orchestrates the streaming of the source CSV, processing the data,
+        and writing it to the output.
+
+        Only rows missing from the manifest are processed and appended. The output is fully
+        rebuilt when `full_rebuild` is set, when there is no manifest or output yet, or when a
+        row that was already processed changed in or was removed from the source.
+
+        Returns:
+            int: Number of rows written.
         """
         print(f"Starting annotation processing...")
         print(f"Source CSV: {self.csv_annotations_source_path}")
-        print(f"Output CSV: {self.output_csv_path}")
+        print(f"Output: {self.output_csv_path} ({self.output_format})")
+
+        if not os.path.exists(self.csv_annotations_source_path):
+            print(f"Error: Source CSV file not found at {self.csv_annotations_source_path}")
+            return 0
 
-        processed_data = self._extract_and_process_data()
-        self._write_processed_csv(processed_data)
+        self._recover_pending_manifests()
+
+        manifest, manifest_rows = {}, 0
+        if not full_rebuild and self._output_exists():
+            manifest, manifest_rows = self._load_manifest()
+        append = bool(manifest)
+
+        try:
+            if append and self.output_format == OUTPUT_FORMAT_CSV:
+                self._truncate_csv_output(manifest_rows)
+            pending_chunks = self._filter_new_rows(self._read_source_chunks(), manifest)
+            rows_written = self._write_processed_csv(self._extract_and_process_data(pending_chunks), append)
+        except ManifestMismatch as e:
+            print(f"{e}, rebuilding all annotations...")
+            append = False
+            pending_chunks = self._filter_new_rows(self._read_source_chunks(), {})
+            rows_written = self._write_processed_csv(self._extract_and_process_data(pending_chunks), append=False)
+
+        mode = "appended" if append else "written"
+        print(f"Successfully {mode} {rows_written} rows to {self.output_csv_path}")
+        return rows_written
 
 
 
 if __name__ == '__main__':
-    image_to_text_annotations_builder = ImageToTextAnnotationsBuilder()
-    image_to_text_annotations_builder.build()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the image to text annotations from the annotations CSV.")
+    parser.add_argument('--source-path', default='datasets/annotations.csv')
+    parser.add_argument('--output-path', default=None,
+                        help="Defaults to datasets/image_to_text_annotations.csv, or the "
+                             "datasets/image_to_text_annotations directory for parquet")
+    parser.add_argument('--output-format', choices=[OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_PARQUET], default=OUTPUT_FORMAT_CSV)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--num-workers', type=int, default=1)
+    parser.add_argument('--full-rebuild', action='store_true')
+    args = parser.parse_args()
+
+    image_to_text_annotations_builder = ImageToTextAnnotationsBuilder(
+        source_path=args.source_path,
+        output_path=args.output_path,
+        output_format=args.output_format,
+        chunk_size=args.chunk_size,
+        num_workers=args.num_workers
+    )
+    image_to_text_annotations_builder.build(full_rebuild=args.full_rebuild)
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import torch
+
+
+AUTOTUNE_SAMPLE_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datasets', 'test.png')
+
+
+def load_autotune_sample_image_bytes(image_path=AUTOTUNE_SAMPLE_IMAGE_PATH):
+    with open(image_path, 'rb') as file:
+        return file.read()
+
+
+class InferenceExecutor:
+    """
+    Dedicated thread pool running the inference of one model.
+
+    Every worker thread owns a share of `threads_per_worker` torch intra-op threads, so `num_workers`
+    concurrent forward passes use at most `num_workers * threads_per_worker` cores instead of
+    each one spreading over the whole machine. With the default OpenMP build of torch,
+    `torch.set_num_threads` sets the thread count of the calling thread, so it is set once when
+    each worker thread starts. A submission acquires the model from the `ModelManager` and runs
+    preprocessing and prediction in a single hop.
+    """
+
+    def __init__(self, model_manager, model_name, num_workers=1, threads_per_worker=0):
+        """
+        Args:
+            model_manager (ModelManager): Manager the model is acquired from for every submission.
+            model_name (str): Name of the model in the manager.
+            num_workers (int): Number of concurrent inferences.
+            threads_per_worker (int): torch intra-op threads of each worker, 0 splits all the cores
+                                      between the workers of this executor.
+        """
+        self.model_manager = model_manager
+        self.model_name = model_name
+        self.num_workers = 1
+        self.threads_per_worker = 1
+        self._executor = None
+        self.configure(num_workers, threads_per_worker)
+
+    def configure(self, num_workers, threads_per_worker=0):
+        """
+        Replaces the worker pool with one of `num_workers` workers of `threads_per_worker` threads.
+        Submissions already queued on the previous pool are completed first.
+        """
+        num_workers = max(1, num_workers)
+        threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+
+        previous_executor = self._executor
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix=f"{self.model_name}-inference",
+            initializer=torch.set_num_threads,
+            initargs=(threads_per_worker,)
+        )
+        print(f"Inference executor '{self.model_name}': "
+              f"{num_workers} workers x {threads_per_worker} threads")
+
+        if previous_executor is not None:
+            previous_executor.shutdown(wait=True)
+
+    def total_threads(self):
+        return self.num_workers * self.threads_per_worker
+
+    def _call(self, fn, args):
+        with self.model_manager.acquire(self.model_name) as model:
+            return fn(model, *args)
+
+    def submit(self, fn, *args):
+        """
+        Schedules `fn(model, *args)` on a worker.
+
+        Returns:
+            concurrent.futures.Future: The result of `fn`.
+        """
+        return self._executor.submit(self._call, fn, args)
+
+    async def run(self, fn, *args):
+        """
+        Awaits `fn(model, *args)` without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def benchmark(self, fn, *args, requests_per_worker=4):
+        """
+        Measures the throughput of the current configuration with `fn(model, *args)`.
+
+        Returns:
+            float: Completed requests per second.
+        """
+        # Warm up: spawns every worker thread and loads the model.
+        wait([self.submit(fn, *args) for _ in range(self.num_workers)])
+
+        num_requests = self.num_workers * requests_per_worker
+        start_time = time.perf_counter()
+        for future in [self.submit(fn, *args) for _ in range(num_requests)]:
+            future.result()
+        return num_requests / (time.perf_counter() - start_time)
+
+    def autotune(self, fn, *args, requests_per_worker=4, max_workers=None, reserved_cores=0):
+        """
+        Benchmarks every workers x threads split of the host cores and keeps the fastest one.
+
+        Args:
+            fn (callable): Inference benchmarked as `fn(model, *args)`.
+            requests_per_worker (int): Number of timed requests per worker for each split.
+            max_workers (int): Largest number of workers tried, defaults to the number of cores.
+            reserved_cores (int): Cores kept for the other executors, only the remaining ones are split.
+
+        Returns:
+            dict: Throughput in requests/s by "<workers>x<threads>" split.
+        """
+        available_cores = max(1, (os.cpu_count() or 1) - reserved_cores)
+        max_workers = min(max_workers or available_cores, available_cores)
+        candidates = []
+        num_workers = 1
+        while num_workers <= max_workers:
+            candidates.append((num_workers, available_cores // num_workers))
+            num_workers *= 2
+
+        print(f"Autotuning inference executor '{self.model_name}' on {available_cores} cores...")
+        results = {}
+        best_split = None
+        best_throughput = 0.0
+        for num_workers, threads_per_worker in candidates:
+            self.configure(num_workers, threads_per_worker)
+            throughput = self.benchmark(fn, *args, requests_per_worker=requests_per_worker)
+            results[f"{num_workers}x{threads_per_worker}"] = round(throughput, 2)
+            print(f"  {num_workers} workers x {threads_per_worker} threads: {throughput:.2f} requests/s")
+            if throughput > best_throughput:
+                best_split = (num_workers, threads_per_worker)
+                best_throughput = throughput
+
+        self.configure(*best_split)
+        print(f"Autotuned '{self.model_name}': {best_split[0]} workers x {best_split[1]} threads "
+              f"({best_throughput:.2f} requests/s)")
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,343 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+
+from config import settings
+
+
+MODEL_STATE_UNLOADED = "unloaded"
+MODEL_STATE_LOADING = "loading"
+MODEL_STATE_LOADED = "loaded"
+
+
+def module_resident_bytes(module):
+    """
+    Returns the number of bytes held by the parameters and buffers of a torch module.
+    Tensors sharing the same storage (e.g. tied embeddings) are only counted once.
+    """
+    if module is None:
+        return 0
+
+    seen_storages = set()
+    total_bytes = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        storage = tensor.untyped_storage()
+        key = (storage.data_ptr(), tensor.device)
+        if key in seen_storages:
+            continue
+        seen_storages.add(key)
+        total_bytes += storage.nbytes()
+    return total_bytes
+
+
+class ModelManager:
+    """
+    Keeps the API models within a memory budget.
+
+    Every registered model must implement `load_model()`, `unload_model()` and `resident_bytes()`.
+    Models are loaded on first use and unloaded after `idle_unload_seconds` without traffic.
+    When loading a model would exceed the budget, the least recently used idle models are
+    unloaded until it fits; if models in use or being loaded still hold the memory, the load
+    waits for them to be released.
+
+    A model being loaded reserves its expected size: the size of its previous load, or the
+    `size_hint_mb` it was registered with before its first load.
+    """
+
+    def __init__(self,
+                 memory_budget_mb=None,
+                 idle_unload_seconds=None,
+                 sweep_interval_seconds=None
+                 ):
+        self.memory_budget_bytes = (memory_budget_mb or settings.MODEL_MEMORY_BUDGET_MB) * 1024 * 1024
+        self.idle_unload_seconds = idle_unload_seconds or settings.MODEL_IDLE_UNLOAD_SECONDS
+        self.sweep_interval_seconds = sweep_interval_seconds or settings.MODEL_IDLE_SWEEP_SECONDS
+
+        # The lock only guards the bookkeeping, it is never held while a model loads, so a slow
+        # load of one model does not stall requests for the others.
+        self._lock = threading.Lock()
+        # Notified whenever memory may have become available: a model released, unloaded or loaded.
+        self._memory_released = threading.Condition(self._lock)
+        self._entries = {}
+
+        self._monitor_thread = None
+        self._monitor_stop = threading.Event()
+
+    def register(self, name, model, size_hint_mb=0):
+        """
+        Args:
+            name (str): Name the model is acquired with.
+            model: Model implementing `load_model()`, `unload_model()` and `resident_bytes()`.
+            size_hint_mb (int): Expected resident size, reserved in the budget for the first load.
+        """
+        with self._lock:
+            self._entries[name] = {
+                'model': model,
+                'state': MODEL_STATE_UNLOADED,
+                # Notified when a load of this model finishes, successfully or not.
+                'load_finished': threading.Condition(self._lock),
+                'in_use': 0,
+                'last_used': 0.0,
+                'resident_bytes': 0,
+                # Size of the last load, reserved in the budget while the model is loading.
+                'resident_bytes_estimate': int(size_hint_mb * 1024 * 1024),
+                'load_count': 0,
+            }
+
+    @contextmanager
+    def acquire(self, name):
+        """
+        Yields the named model, loading it on demand. The model is pinned while the
+        context is active, so it is never unloaded in the middle of a request.
+        Concurrent callers of a model that is being loaded wait for that load, and a load
+        that does not fit in the budget waits for the memory held by the other models.
+        """
+        with self._lock:
+            entry = self._get_entry(name)
+            entry['in_use'] += 1
+            try:
+                evicted = self._wait_until_loadable(name, entry)
+            except BaseException:
+                self._release(entry)
+                raise
+
+            should_load = entry['state'] == MODEL_STATE_UNLOADED
+            if should_load:
+                entry['state'] = MODEL_STATE_LOADING
+
+        try:
+            if evicted:
+                self._release_memory()
+            if should_load:
+                self._load(name, entry)
+        except BaseException:
+            with self._lock:
+                self._release(entry)
+            raise
+
+        with self._lock:
+            entry['last_used'] = time.monotonic()
+
+        try:
+            yield entry['model']
+        finally:
+            with self._lock:
+                self._release(entry)
+
+    def sweep_idle(self):
+        """
+        Unloads every model that has been idle longer than `idle_unload_seconds`.
+        """
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            for name, entry in self._entries.items():
+                if entry['in_use'] or entry['state'] != MODEL_STATE_LOADED:
+                    continue
+                if now - entry['last_used'] >= self.idle_unload_seconds:
+                    self._unload(name, entry)
+                    evicted += 1
+
+        if evicted:
+            self._release_memory()
+
+    def start_idle_monitor(self):
+        if self._monitor_thread is not None and self._monitor_thread.is_alive():
+            return
+
+        self._monitor_stop.clear()
+        self._monitor_thread = threading.Thread(
+            target=self._idle_monitor_loop,
+            name="model-manager-idle-monitor",
+            daemon=True
+        )
+        self._monitor_thread.start()
+
+    def stop_idle_monitor(self):
+        self._monitor_stop.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join(timeout=self.sweep_interval_seconds)
+            self._monitor_thread = None
+
+    def is_loaded(self, name):
+        with self._lock:
+            return self._get_entry(name)['state'] == MODEL_STATE_LOADED
+
+    def fits_in_budget(self, names):
+        """
+        Returns whether the named models can be resident at the same time, counting the
+        current size of the loaded ones and the expected size of the others.
+        """
+        with self._lock:
+            required_bytes = 0
+            for name in names:
+                entry = self._get_entry(name)
+                if entry['state'] == MODEL_STATE_LOADED:
+                    required_bytes += entry['resident_bytes']
+                else:
+                    required_bytes += entry['resident_bytes_estimate']
+            return required_bytes <= self.memory_budget_bytes
+
+    def total_resident_bytes(self):
+        with self._lock:
+            return self._total_resident_bytes()
+
+    def report(self):
+        """
+        Returns the state and resident size of every registered model.
+        """
+        now = time.monotonic()
+        with self._lock:
+            models_report = {}
+            for name, entry in self._entries.items():
+                models_report[name] = {
+                    'state': entry['state'],
+                    'in_use': entry['in_use'],
+                    'resident_mb': round(entry['resident_bytes'] / (1024 * 1024), 2),
+                    'idle_seconds': round(now - entry['last_used'], 1) if entry['last_used'] else None,
+                    'load_count': entry['load_count'],
+                }
+
+            return {
+                'memory_budget_mb': round(self.memory_budget_bytes / (1024 * 1024), 2),
+                'total_resident_mb': round(self._total_resident_bytes() / (1024 * 1024), 2),
+                'models': models_report,
+            }
+
+    def _get_entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered in the model manager.")
+        return entry
+
+    def _total_resident_bytes(self):
+        """
+        Bytes held by the loaded models plus the bytes reserved by the models being loaded.
+        """
+        total_bytes = 0
+        for entry in self._entries.values():
+            if entry['state'] == MODEL_STATE_LOADING:
+                total_bytes += entry['resident_bytes_estimate']
+            else:
+                total_bytes += entry['resident_bytes']
+        return total_bytes
+
+    def _release(self, entry):
+        entry['in_use'] -= 1
+        entry['last_used'] = time.monotonic()
+        self._memory_released.notify_all()
+
+    def _holds_releasable_memory(self, exclude):
+        """
+        Returns whether another model is being loaded or pinned by a request, i.e. holds memory
+        that will be given back without evicting anything.
+        """
+        return any(
+            entry['state'] == MODEL_STATE_LOADING or (entry['state'] == MODEL_STATE_LOADED and entry['in_use'])
+            for name, entry in self._entries.items() if name != exclude
+        )
+
+    def _wait_until_loadable(self, name, entry):
+        """
+        Waits until the model is loaded by another caller, or until its expected size fits in the
+        budget after evicting idle models. A model larger than the whole budget is loaded once
+        nothing else can be released. Must be called with the lock held.
+
+        Returns:
+            int: Number of unloaded models.
+        """
+        evicted = 0
+        while True:
+            if entry['state'] == MODEL_STATE_LOADING:
+                entry['load_finished'].wait()
+                continue
+            if entry['state'] == MODEL_STATE_LOADED:
+                return evicted
+
+            required_bytes = entry['resident_bytes_estimate']
+            evicted += self._make_room(required_bytes, exclude=name)
+            if self._total_resident_bytes() + required_bytes <= self.memory_budget_bytes:
+                return evicted
+            if not self._holds_releasable_memory(exclude=name):
+                print(f"Warning: model '{name}' does not fit in the memory budget of "
+                      f"{self.memory_budget_bytes / (1024 * 1024):.0f} MB, loading it anyway")
+                return evicted
+
+            print(f"Waiting for memory to be released before loading model '{name}'...")
+            self._memory_released.wait()
+
+    def _load(self, name, entry):
+        """
+        Loads a model already marked as loading, without holding the lock.
+        """
+        start_time = time.perf_counter()
+        try:
+            entry['model'].load_model()
+            resident_bytes = entry['model'].resident_bytes()
+        except BaseException:
+            with self._lock:
+                entry['state'] = MODEL_STATE_UNLOADED
+                entry['load_finished'].notify_all()
+                self._memory_released.notify_all()
+            raise
+
+        with self._lock:
+            entry['state'] = MODEL_STATE_LOADED
+            entry['resident_bytes'] = resident_bytes
+            entry['resident_bytes_estimate'] = resident_bytes
+            entry['load_count'] += 1
+            entry['load_finished'].notify_all()
+            self._memory_released.notify_all()
+            # The actual size may differ from the reserved one.
+            evicted = self._make_room(0, exclude=name)
+
+        print(f"Model '{name}' loaded in {time.perf_counter() - start_time:.2f}s "
+              f"({resident_bytes / (1024 * 1024):.1f} MB resident)")
+        if evicted:
+            self._release_memory()
+
+    def _unload(self, name, entry):
+        entry['model'].unload_model()
+        entry['state'] = MODEL_STATE_UNLOADED
+        entry['resident_bytes'] = 0
+        self._memory_released.notify_all()
+        print(f"Model '{name}' unloaded")
+
+    def _make_room(self, required_bytes, exclude=None):
+        """
+        Unloads the least recently used idle models until `required_bytes` fit in the memory budget.
+        Must be called with the lock held; the caller releases the memory once the lock is released.
+
+        Returns:
+            int: Number of unloaded models.
+        """
+        candidates = sorted(
+            (
+                (name, entry) for name, entry in self._entries.items()
+                if name != exclude and not entry['in_use'] and entry['state'] == MODEL_STATE_LOADED
+            ),
+            key=lambda item: item[1]['last_used']
+        )
+
+        evicted = 0
+        for name, entry in candidates:
+            if self._total_resident_bytes() + required_bytes <= self.memory_budget_bytes:
+                break
+            self._unload(name, entry)
+            evicted += 1
+        return evicted
+
+    def _release_memory(self):
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _idle_monitor_loop(self):
+        while not self._monitor_stop.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep_idle()
+            except Exception as e:
+                print(f"Error while sweeping idle models: {e}")
@@ -0,0 +1,315 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageChops, ImageSequence, ImageStat
+
+
+SAMPLING_RATE = 'rate'
+SAMPLING_SCENE = 'scene'
+
+IMAGE_SEQUENCE_CONTENT_TYPES = ["image/gif", "image/webp", "image/tiff", "image/apng", "image/png"]
+IMAGE_SEQUENCE_EXTENSIONS = [".gif", ".webp", ".tif", ".tiff", ".apng", ".png"]
+
+
+def iter_video_frames(file):
+    """
+    Decodes a video container frame by frame with PyAV.
+
+    Yields:
+        tuple: (timestamp_seconds, frame_index, to_image) where `to_image()` converts the frame
+               to a PIL image. Frames dropped by the sampler are never converted.
+    """
+    try:
+        import av
+    except ImportError as e:
+        raise ImportError("PyAV is required to decode videos: pip install av") from e
+
+    try:
+        container = av.open(file)
+    except av.error.FFmpegError as e:
+        raise ValueError(f"Invalid video file: {e}")
+
+    with container:
+        if not container.streams.video:
+            raise ValueError("Invalid video file: no video stream found.")
+
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        frame_rate = float(stream.average_rate or 30)
+
+        frames = enumerate(container.decode(stream))
+        while True:
+            # Only the decoding is guarded, errors raised by the consumer of the frames propagate as is.
+            try:
+                frame_index, frame = next(frames)
+            except StopIteration:
+                return
+            except av.error.FFmpegError as e:
+                raise ValueError(f"Invalid video file: {e}")
+
+            timestamp = float(frame.time) if frame.time is not None else frame_index / frame_rate
+            yield timestamp, frame_index, frame.to_image
+
+
+def iter_image_sequence_frames(file):
+    """
+    Decodes a GIF or another multi-frame image frame by frame with PIL.
+
+    Yields:
+        tuple: (timestamp_seconds, frame_index, to_image), `to_image()` must be called before the next frame.
+    """
+    try:
+        image = Image.open(file)
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {e}")
+
+    timestamp = 0.0
+    frames = enumerate(ImageSequence.Iterator(image))
+    while True:
+        # Truncated or corrupted frames fail while seeking to them or when they are converted.
+        try:
+            frame_index, frame = next(frames)
+        except StopIteration:
+            return
+        except Exception as e:
+            raise ValueError(f"Invalid image file: {e}")
+
+        yield timestamp, frame_index, lambda: convert_image_sequence_frame(frame)
+        timestamp += (frame.info.get('duration') or 100) / 1000.0
+
+
+def convert_image_sequence_frame(frame):
+    try:
+        return frame.convert('RGB')
+    except Exception as e:
+        raise ValueError(f"Invalid image file: {e}")
+
+
+class ComponentStateTimeline:
+    """
+    Turns per-frame open probabilities into a list of component state change events.
+
+    A new state is only reported after `min_consecutive` sampled frames agree, which filters
+    out single-frame flickers; the event is timestamped at the first of these frames.
+    """
+
+    def __init__(self, component_names, threshold=0.5, min_consecutive=1):
+        self.component_names = component_names
+        self.threshold = threshold
+        self.min_consecutive = max(1, min_consecutive)
+
+        self.initial_state = None
+        self.current_state = {}
+        self.pending_state = {}
+        self.events = []
+        self.frames_sampled = 0
+        self.last_timestamp = 0.0
+
+    def update(self, timestamp, frame_index, probabilities):
+        self.frames_sampled += 1
+        self.last_timestamp = timestamp
+
+        states = {
+            name: "Open" if probabilities[i] > self.threshold else "Closed"
+            for i, name in enumerate(self.component_names)
+        }
+
+        if self.initial_state is None:
+            self.initial_state = {
+                name: {'state': states[name], 'confidence_open': float(probabilities[i])}
+                for i, name in enumerate(self.component_names)
+            }
+            self.current_state = dict(states)
+            return
+
+        for i, name in enumerate(self.component_names):
+            state = states[name]
+            if state == self.current_state[name]:
+                self.pending_state.pop(name, None)
+                continue
+
+            pending = self.pending_state.get(name)
+            if pending is None or pending['state'] != state:
+                pending = {
+                    'state': state,
+                    'count': 0,
+                    'timestamp': timestamp,
+                    'frame_index': frame_index,
+                    'confidence_open': float(probabilities[i]),
+                }
+                self.pending_state[name] = pending
+            pending['count'] += 1
+
+            if pending['count'] >= self.min_consecutive:
+                self.events.append({
+                    'timestamp': round(pending['timestamp'], 3),
+                    'frame_index': pending['frame_index'],
+                    'component': name,
+                    'from': self.current_state[name],
+                    'to': state,
+                    'confidence_open': pending['confidence_open'],
+                })
+                self.current_state[name] = state
+                del self.pending_state[name]
+
+    def to_dict(self):
+        return {
+            'initial_state': self.initial_state,
+            'events': sorted(self.events, key=lambda event: (event['timestamp'], event['component'])),
+            'final_state': self.current_state,
+            'frames_sampled': self.frames_sampled,
+            'duration': round(self.last_timestamp, 3),
+        }
+
+
+class VideoTimelineBuilder:
+    def __init__(self,
+                 submit_batch,
+                 component_names,
+                 sampling=SAMPLING_RATE,
+                 fps=2.0,
+                 scene_threshold=0.08,
+                 batch_size=16,
+                 max_batches_in_flight=2,
+                 min_consecutive=1,
+                 frame_size=(320, 320)
+                 ):
+        """
+        Initializes the VideoTimelineBuilder.
+
+        Args:
+            submit_batch (callable): Schedules the prediction of a list of PIL images and returns a
+                                     `concurrent.futures.Future` of their open probabilities, shape (n, components).
+            component_names (list): Component names, in the order of the predicted probabilities.
+            sampling (str): 'rate' keeps `fps` frames per second, 'scene' keeps frames that differ from
+                            the last kept frame by more than `scene_threshold`.
+            fps (float): Sampling rate for the 'rate' sampling.
+            scene_threshold (float): Mean absolute difference (0-1) of 32x32 grayscale thumbnails for the 'scene' sampling.
+            batch_size (int): Number of frames per prediction.
+            max_batches_in_flight (int): Number of batches predicted while decoding continues, bounds the memory.
+            min_consecutive (int): Number of sampled frames a new state must persist before it is reported.
+            frame_size (tuple): Size sampled frames are reduced to right after decoding.
+        """
+        if sampling not in (SAMPLING_RATE, SAMPLING_SCENE):
+            raise ValueError(f"Unsupported sampling: {sampling}")
+        if sampling == SAMPLING_RATE and fps <= 0:
+            raise ValueError("fps must be positive.")
+
+        self.submit_batch = submit_batch
+        self.component_names = component_names
+        self.sampling = sampling
+        self.fps = fps
+        self.scene_threshold = scene_threshold
+        self.batch_size = max(1, batch_size)
+        self.max_batches_in_flight = max(1, max_batches_in_flight)
+        self.min_consecutive = min_consecutive
+        self.frame_size = frame_size
+
+    def _iter_frames(self, file, filename=None, content_type=None):
+        extension = os.path.splitext(filename or '')[1].lower()
+        if content_type in IMAGE_SEQUENCE_CONTENT_TYPES or extension in IMAGE_SEQUENCE_EXTENSIONS:
+            return iter_image_sequence_frames(file)
+        return iter_video_frames(file)
+
+    def _iter_sampled_frames(self, frames):
+        """
+        Yields:
+            tuple: (timestamp_seconds, frame_index, image) for the frames kept by the sampler.
+        """
+        next_sample_timestamp = 0.0
+        last_thumbnail = None
+
+        for timestamp, frame_index, to_image in frames:
+            if self.sampling == SAMPLING_RATE:
+                if timestamp + 1e-6 < next_sample_timestamp:
+                    continue
+                next_sample_timestamp = timestamp + 1.0 / self.fps
+                image = to_image()
+            else:
+                image = to_image()
+                thumbnail = image.convert('L').resize((32, 32), Image.Resampling.BILINEAR)
+                if last_thumbnail is not None:
+                    difference = ImageStat.Stat(ImageChops.difference(thumbnail, last_thumbnail)).mean[0] / 255.0
+                    if difference < self.scene_threshold:
+                        continue
+                last_thumbnail = thumbnail
+
+            yield timestamp, frame_index, image.convert('RGB').resize(self.frame_size, Image.Resampling.BILINEAR)
+
+    def build(self, file, filename=None, content_type=None):
+        """
+        Streams the frames of `file`, predicts the sampled ones in batches and builds the timeline.
+        Decoding continues while up to `max_batches_in_flight` batches are being predicted.
+
+        Returns:
+            dict: The timeline, see `ComponentStateTimeline.to_dict`.
+        """
+        start_time = time.perf_counter()
+        timeline = ComponentStateTimeline(self.component_names, min_consecutive=self.min_consecutive)
+        in_flight = deque()
+
+        def drain_oldest_batch():
+            batch_meta, future = in_flight.popleft()
+            for (timestamp, frame_index), probabilities in zip(batch_meta, future.result()):
+                timeline.update(timestamp, frame_index, probabilities)
+
+        batch_meta = []
+        batch_images = []
+        sampled_frames = self._iter_sampled_frames(self._iter_frames(file, filename, content_type))
+        for timestamp, frame_index, image in sampled_frames:
+            batch_meta.append((timestamp, frame_index))
+            batch_images.append(image)
+
+            if len(batch_images) >= self.batch_size:
+                in_flight.append((batch_meta, self.submit_batch(batch_images)))
+                batch_meta = []
+                batch_images = []
+                if len(in_flight) > self.max_batches_in_flight:
+                    drain_oldest_batch()
+
+        if batch_images:
+            in_flight.append((batch_meta, self.submit_batch(batch_images)))
+        while in_flight:
+            drain_oldest_batch()
+
+        if timeline.initial_state is None:
+            raise ValueError("No frame could be decoded from the file.")
+
+        result = timeline.to_dict()
+        result['processing_seconds'] = round(time.perf_counter() - start_time, 3)
+        return result
+
+
+if __name__ == '__main__':
+    import json
+
+    from models.car_physical_change_classifier import CarPhysicalChangeClassifier
+
+    parser = argparse.ArgumentParser(description="Build the component state timeline of a video or an animated image.")
+    parser.add_argument('path')
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--sampling', choices=[SAMPLING_RATE, SAMPLING_SCENE], default=SAMPLING_RATE)
+    parser.add_argument('--fps', type=float, default=2.0)
+    parser.add_argument('--scene-threshold', type=float, default=0.08)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--min-consecutive', type=int, default=1)
+    args = parser.parse_args()
+
+    model = CarPhysicalChangeClassifier(model_path=args.model_path)
+    model.load_model()
+
+    with ThreadPoolExecutor(max_workers=1) as inference_executor, open(args.path, 'rb') as video_file:
+        video_timeline_builder = VideoTimelineBuilder(
+            submit_batch=lambda images: inference_executor.submit(model.predict_frames, images),
+            component_names=model.COMPONENT_NAMES,
+            sampling=args.sampling,
+            fps=args.fps,
+            scene_threshold=args.scene_threshold,
+            batch_size=args.batch_size,
+            min_consecutive=args.min_consecutive,
+            frame_size=(model.IMG_WIDTH, model.IMG_HEIGHT)
+        )
+        print(json.dumps(video_timeline_builder.build(video_file, filename=args.path), indent=2))
@@ -0,0 +1,96 @@
+import os
+from typing import Optional
+
+from config import settings
+from models.car_physical_change_classifier import CarPhysicalChangeClassifier
+from models.car_physical_change_explainer import CarPhysicalChangeExplainer
+from models.embedding_index import EmbeddingIndex
+from models.inference_executor import InferenceExecutor, load_autotune_sample_image_bytes
+from models.model_manager import ModelManager
+
+# API singletons, created when the API imports its routers. They live outside the `models`
+# package so the offline tools (builders, trainer, CLIs) import it without side effects.
+
+CLASSIFIER_MODEL_NAME = "classifier"
+EXPLAINER_MODEL_NAME = "explainer"
+
+model_manager = ModelManager()
+
+model_manager.register(
+    CLASSIFIER_MODEL_NAME,
+    CarPhysicalChangeClassifier(),
+    size_hint_mb=settings.CLASSIFIER_MODEL_SIZE_HINT_MB
+)
+model_manager.register(
+    EXPLAINER_MODEL_NAME,
+    CarPhysicalChangeExplainer(),
+    size_hint_mb=settings.EXPLAINER_MODEL_SIZE_HINT_MB
+)
+
+model_manager.start_idle_monitor()
+
+# The default thread share splits the cores between the workers of both executors, so a classifier
+# and an explainer inference running at the same time never use more threads than there are cores.
+total_inference_workers = max(1, settings.CLASSIFIER_INFERENCE_WORKERS) + max(1, settings.EXPLAINER_INFERENCE_WORKERS)
+default_threads_per_worker = max(1, (os.cpu_count() or 1) // total_inference_workers)
+
+classifier_executor = InferenceExecutor(
+    model_manager,
+    CLASSIFIER_MODEL_NAME,
+    num_workers=settings.CLASSIFIER_INFERENCE_WORKERS,
+    threads_per_worker=settings.CLASSIFIER_INFERENCE_THREADS or default_threads_per_worker
+)
+explainer_executor = InferenceExecutor(
+    model_manager,
+    EXPLAINER_MODEL_NAME,
+    num_workers=settings.EXPLAINER_INFERENCE_WORKERS,
+    threads_per_worker=settings.EXPLAINER_INFERENCE_THREADS or default_threads_per_worker
+)
+
+embedding_index = None
+if settings.EMBEDDING_INDEX_PATH and os.path.exists(settings.EMBEDDING_INDEX_PATH):
+    embedding_index = EmbeddingIndex.load(settings.EMBEDDING_INDEX_PATH)
+    print(f"Embedding index loaded with {len(embedding_index)} reference frames")
+
+
+def get_model_manager() -> ModelManager:
+    return model_manager
+
+
+def get_classifier_executor() -> InferenceExecutor:
+    return classifier_executor
+
+
+def get_explainer_executor() -> InferenceExecutor:
+    return explainer_executor
+
+
+def get_embedding_index() -> Optional[EmbeddingIndex]:
+    return embedding_index
+
+
+def autotune_inference_executors():
+    sample_image_bytes = load_autotune_sample_image_bytes()
+    # Each executor is tuned on the cores left by the other one.
+    classifier_executor.autotune(
+        CarPhysicalChangeClassifier.predict_image_bytes,
+        sample_image_bytes,
+        reserved_cores=explainer_executor.total_threads()
+    )
+
+    # A BLIP generation takes seconds and autotuning loads the model, so the explainer is
+    # opt-in and only tries a few splits with a single timed request each.
+    if settings.INFERENCE_AUTOTUNE_EXPLAINER:
+        explainer_executor.autotune(
+            CarPhysicalChangeExplainer.completions_image_bytes,
+            sample_image_bytes,
+            requests_per_worker=1,
+            max_workers=2,
+            reserved_cores=classifier_executor.total_threads()
+        )
+
+
+def shutdown_inference_executors():
+    classifier_executor.shutdown()
+    explainer_executor.shutdown()
+
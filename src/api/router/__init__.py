@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
-from src.api.router import classifier_endpoint, explainer_endpoint
+from src.api.router import classifier_endpoint, explainer_endpoint, models_endpoint
 
 api_router = APIRouter()
 
 api_router.include_router(classifier_endpoint.router, prefix="/classifier", tags=["classifier"])
-api_router.include_router(explainer_endpoint.router, prefix="/explainer", tags=["explainer"])
\ No newline at end of file
+api_router.include_router(explainer_endpoint.router, prefix="/explainer", tags=["explainer"])
+api_router.include_router(models_endpoint.router, prefix="/models", tags=["models"])
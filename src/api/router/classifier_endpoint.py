@@ -1,19 +1,29 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 from fastapi.logger import logger
 from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 
-from models import CarPhysicalChangeClassifier, get_classifier_model
+from config import settings
+from models.car_physical_change_classifier import CarPhysicalChangeClassifier
+from models.embedding_index import EmbeddingIndex, StaleEmbeddingIndex, search_image_bytes, \
+    predict_image_bytes_with_index
+from models.inference_executor import InferenceExecutor
+from models.video_timeline import VideoTimelineBuilder, SAMPLING_RATE, SAMPLING_SCENE, IMAGE_SEQUENCE_CONTENT_TYPES
+from src.api.dependencies import get_classifier_executor, get_embedding_index
 
 router = APIRouter()
 
-ClassifierModelDep = Annotated[CarPhysicalChangeClassifier, Depends(get_classifier_model)]
+ClassifierExecutorDep = Annotated[InferenceExecutor, Depends(get_classifier_executor)]
+EmbeddingIndexDep = Annotated[Optional[EmbeddingIndex], Depends(get_embedding_index)]
 
 
 @router.post("/predict", summary="Predict which component car changes")
-async def predict(model: ClassifierModelDep, image: UploadFile = File(...)):
+async def predict(executor: ClassifierExecutorDep,
+                  embedding_index: EmbeddingIndexDep,
+                  image: UploadFile = File(...),
+                  fast_path: bool = Query(False, description="Answer from the closest reference frame when it is close enough")):
     try:
         # 1. Read image contents
         image_contents = await image.read()
@@ -31,18 +41,23 @@ async def predict(model: ClassifierModelDep, image: UploadFile = File(...)):
                 )
             )
 
-        # 3. Perform blocking operations (preprocessing and prediction) in a thread pool
+        # 3. Perform blocking operations (preprocessing and prediction) in a single hop to the model executor
         try:
-            # Run synchronous preprocessing in a thread pool
-            input_tensor = await run_in_threadpool(model.preprocess_image_bytes, image_contents)
-
-            # Run synchronous prediction in a thread pool
-            prediction_result = await run_in_threadpool(model.predict_image, input_tensor)
+            if fast_path and embedding_index is not None:
+                prediction_result, prediction_source = await executor.run(
+                    predict_image_bytes_with_index,
+                    image_contents,
+                    embedding_index,
+                    settings.EMBEDDING_FAST_PATH_MAX_DISTANCE
+                )
+            else:
+                prediction_result = await executor.run(CarPhysicalChangeClassifier.predict_image_bytes, image_contents)
+                prediction_source = "model"
         except ValueError as ve:  # Catch specific errors from preprocessing/prediction
             logger.warning(f"ValueError during model processing: {ve}")
             raise HTTPException(status_code=400, detail=str(ve))
 
-        return JSONResponse(prediction_result)
+        return JSONResponse(prediction_result, headers={"X-Prediction-Source": prediction_source})
 
     except HTTPException as e:
         # Re-raise HTTPException to be handled by FastAPI's default error handling
@@ -59,3 +74,111 @@ async def predict(model: ClassifierModelDep, image: UploadFile = File(...)):
         # Always close the uploaded file
         if image:
             await image.close()
+
+
+@router.post("/neighbors", summary="Find the closest reference frames")
+async def neighbors(executor: ClassifierExecutorDep,
+                    embedding_index: EmbeddingIndexDep,
+                    image: UploadFile = File(...),
+                    k: int = Query(5, ge=1, le=100)):
+    try:
+        if embedding_index is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Embedding index not found, build it with `python -m models.embedding_index_builder`."
+            )
+
+        # 1. Read image contents
+        image_contents = await image.read()
+        if not image_contents:
+            raise HTTPException(status_code=400, detail="No image content found or image is empty.")
+
+        # 2. Basic validation (can be expanded)
+        allowed_image_types = ["image/jpeg", "image/png"]  # Example, adjust as needed
+        if image.content_type not in allowed_image_types:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Invalid image type: {image.content_type}. "
+                    f"Allowed types are: {', '.join(allowed_image_types)}"
+                )
+            )
+
+        # 3. Embed the image and search the index in a single hop to the model executor
+        try:
+            neighbors_result = await executor.run(search_image_bytes, image_contents, embedding_index, k)
+        except StaleEmbeddingIndex as e:
+            raise HTTPException(status_code=503, detail=f"{e} `python -m models.embedding_index_builder`")
+        except ValueError as ve:
+            logger.warning(f"ValueError during model processing: {ve}")
+            raise HTTPException(status_code=400, detail=str(ve))
+
+        return JSONResponse(neighbors_result)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in /neighbors endpoint: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal server error occurred while processing the image.")
+    finally:
+        if image:
+            await image.close()
+
+
+@router.post("/timeline", summary="Timeline of component state changes in a video or an animated image")
+async def timeline(executor: ClassifierExecutorDep,
+                   video: UploadFile = File(...),
+                   sampling: str = Query(SAMPLING_RATE, pattern=f"^({SAMPLING_RATE}|{SAMPLING_SCENE})$"),
+                   fps: float = Query(2.0, gt=0, le=60),
+                   scene_threshold: float = Query(0.08, gt=0, lt=1),
+                   batch_size: int = Query(16, ge=1, le=64),
+                   min_consecutive: int = Query(1, ge=1, le=30)):
+    try:
+        # 1. Basic validation (can be expanded)
+        content_type = video.content_type or ""
+        allowed_sequence_types = IMAGE_SEQUENCE_CONTENT_TYPES + ["application/octet-stream"]
+        if not content_type.startswith("video/") and content_type not in allowed_sequence_types:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Invalid video type: {content_type}. "
+                    f"Allowed types are: video/*, {', '.join(allowed_sequence_types)}"
+                )
+            )
+
+        video_timeline_builder = VideoTimelineBuilder(
+            submit_batch=lambda images: executor.submit(CarPhysicalChangeClassifier.predict_frames, images),
+            component_names=CarPhysicalChangeClassifier.COMPONENT_NAMES,
+            sampling=sampling,
+            fps=fps,
+            scene_threshold=scene_threshold,
+            batch_size=batch_size,
+            min_consecutive=min_consecutive,
+            frame_size=(CarPhysicalChangeClassifier.IMG_WIDTH, CarPhysicalChangeClassifier.IMG_HEIGHT)
+        )
+
+        # 2. Decode the spooled upload in a thread while sampled batches are predicted on the model executor
+        try:
+            timeline_result = await run_in_threadpool(
+                video_timeline_builder.build,
+                video.file,
+                video.filename,
+                content_type
+            )
+        except ValueError as ve:
+            logger.warning(f"ValueError during video processing: {ve}")
+            raise HTTPException(status_code=400, detail=str(ve))
+        except ImportError as ie:
+            logger.error(f"Video decoding unavailable: {ie}")
+            raise HTTPException(status_code=501, detail=str(ie))
+
+        return JSONResponse(timeline_result)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in /timeline endpoint: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal server error occurred while processing the video.")
+    finally:
+        if video:
+            await video.close()
@@ -1,19 +1,33 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
 from fastapi.logger import logger
-from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse
 
-from models import CarPhysicalChangeExplainer, get_explainer_model
+from config import settings
+from models.car_physical_change_explainer import CarPhysicalChangeExplainer
+from models.embedding_index import EmbeddingIndex, StaleEmbeddingIndex, search_image_bytes
+from models.image_to_text_annotations_builder import build_text_annotation
+from models.inference_executor import InferenceExecutor
+from models.model_manager import ModelManager
+from src.api.dependencies import CLASSIFIER_MODEL_NAME, EXPLAINER_MODEL_NAME, get_explainer_executor, \
+    get_classifier_executor, get_embedding_index, get_model_manager
 
 router = APIRouter()
 
-ExplainerModelDep = Annotated[CarPhysicalChangeExplainer, Depends(get_explainer_model)]
+ExplainerExecutorDep = Annotated[InferenceExecutor, Depends(get_explainer_executor)]
+ClassifierExecutorDep = Annotated[InferenceExecutor, Depends(get_classifier_executor)]
+EmbeddingIndexDep = Annotated[Optional[EmbeddingIndex], Depends(get_embedding_index)]
+ModelManagerDep = Annotated[ModelManager, Depends(get_model_manager)]
 
 
 @router.post("/predict", summary="Explain car state components image")
-async def predict(model: ExplainerModelDep, image: UploadFile = File(...)):
+async def predict(executor: ExplainerExecutorDep,
+                  classifier_executor: ClassifierExecutorDep,
+                  embedding_index: EmbeddingIndexDep,
+                  manager: ModelManagerDep,
+                  image: UploadFile = File(...),
+                  fast_path: bool = Query(False, description="Caption the closest reference frame when it is close enough")):
     try:
         # 1. Read image contents
         image_contents = await image.read()
@@ -34,18 +48,34 @@ async def predict(model: ExplainerModelDep, image: UploadFile = File(...)):
         # input_tensor = model.preprocess_image(image_contents)
         # prediction_result = model.predict_image(input_tensor)
 
-        # 3. Perform blocking operations (preprocessing and prediction) in a thread pool
+        # 3. Perform blocking operations (preprocessing and prediction) in a single hop to the model executor
         try:
-            # Run synchronous preprocessing in a thread pool
-            input_tensor = await run_in_threadpool(model.preprocess_image_bytes, image_contents)
+            prediction_result = None
+            prediction_source = "model"
+            # Loading the classifier for the lookup must not evict BLIP, otherwise every miss
+            # reloads BLIP which evicts the classifier again.
+            if fast_path and embedding_index is not None and (
+                    manager.is_loaded(CLASSIFIER_MODEL_NAME)
+                    or manager.fits_in_budget([CLASSIFIER_MODEL_NAME, EXPLAINER_MODEL_NAME])):
+                # A classifier embedding and an index lookup are much cheaper than a BLIP generation.
+                try:
+                    neighbors_result = await classifier_executor.run(search_image_bytes, image_contents, embedding_index, 1)
+                except StaleEmbeddingIndex as e:
+                    logger.warning(f"Skipping the fast path: {e}")
+                    neighbors_result = []
+                if neighbors_result and neighbors_result[0]['distance'] <= settings.EMBEDDING_FAST_PATH_MAX_DISTANCE:
+                    annotation_row = embedding_index.annotation_row_from_neighbor(neighbors_result[0])
+                    # Single line and lowercase like the BLIP captions, the annotation template is indented.
+                    prediction_result = ' '.join(build_text_annotation(annotation_row)['text'].split()).lower()
+                    prediction_source = "index"
 
-            # Run synchronous prediction in a thread pool
-            prediction_result = await run_in_threadpool(model.completions, input_tensor)
+            if prediction_result is None:
+                prediction_result = await executor.run(CarPhysicalChangeExplainer.completions_image_bytes, image_contents)
         except ValueError as ve:  # Catch specific errors from preprocessing/prediction
             logger.warning(f"ValueError during model processing: {ve}")
             raise HTTPException(status_code=400, detail=str(ve))
 
-        return JSONResponse(prediction_result)
+        return JSONResponse(prediction_result, headers={"X-Prediction-Source": prediction_source})
 
     except HTTPException as e:
         # Re-raise HTTPException to be handled by FastAPI's default error handling
@@ -0,0 +1,16 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from starlette.responses import JSONResponse
+
+from models.model_manager import ModelManager
+from src.api.dependencies import get_model_manager
+
+router = APIRouter()
+
+ModelManagerDep = Annotated[ModelManager, Depends(get_model_manager)]
+
+
+@router.get("/status", summary="Resident size and state of each model")
+async def status(manager: ModelManagerDep):
+    return JSONResponse(manager.report())
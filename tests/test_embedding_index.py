@@ -0,0 +1,191 @@
+import numpy as np
+import pytest
+
+from models.embedding_index import (
+    EmbeddingIndex,
+    StaleEmbeddingIndex,
+    parse_capture_filename,
+    predict_image_bytes_with_index,
+    search_image_bytes,
+    weights_fingerprint,
+)
+
+
+COMPONENT_NAMES = ['front_left', 'hood']
+
+
+def make_index(embeddings, weights_fingerprint='weights', **kwargs):
+    count = len(embeddings)
+    return EmbeddingIndex(
+        embeddings=embeddings,
+        labels=[[index % 2, 1 - index % 2] for index in range(count)],
+        filenames=[f"{index}.png" for index in range(count)],
+        views=['view_front'] * count,
+        tilts=list(range(count)),
+        component_names=COMPONENT_NAMES,
+        weights_fingerprint=weights_fingerprint,
+        **kwargs
+    )
+
+
+def random_unit_vectors(count, dim, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cosine_distances(embeddings, query):
+    return 1.0 - embeddings @ (query / np.linalg.norm(query))
+
+
+def test_parse_capture_filename():
+    assert parse_capture_filename('view_front_front_left_closed_hood_opened_7.png') == ('view_front', 7)
+    assert parse_capture_filename('datasets/view_side_left_front_left_opened_hood_closed_x.png') == \
+        ('view_side_left', None)
+    assert parse_capture_filename('test.png') == (None, None)
+
+
+def test_search_returns_the_k_closest_frames_in_order():
+    embeddings = random_unit_vectors(50, 16)
+    index = make_index(embeddings)
+    query = embeddings[7] + 0.05 * random_unit_vectors(1, 16, seed=1)[0]
+
+    neighbors = index.search(query, k=5)
+
+    expected_order = np.argsort(cosine_distances(embeddings, query))[:5]
+    assert [neighbor['filename'] for neighbor in neighbors] == [f"{i}.png" for i in expected_order]
+    assert neighbors[0]['filename'] == '7.png'
+    distances = [neighbor['distance'] for neighbor in neighbors]
+    assert distances == sorted(distances)
+    np.testing.assert_allclose(distances, cosine_distances(embeddings, query)[expected_order], atol=1e-5)
+
+
+def test_search_clamps_k_to_the_index_size():
+    index = make_index(random_unit_vectors(3, 4))
+
+    assert len(index.search(random_unit_vectors(1, 4)[0], k=10)) == 3
+
+
+def test_neighbor_reports_labels_view_and_tilt():
+    embeddings = random_unit_vectors(4, 8)
+    index = make_index(embeddings)
+
+    neighbor = index.search(embeddings[3], k=1)[0]
+
+    assert neighbor['filename'] == '3.png'
+    assert neighbor['distance'] == pytest.approx(0.0, abs=1e-5)
+    assert neighbor['view'] == 'view_front'
+    assert neighbor['tilt'] == 3
+    assert neighbor['labels'] == {'front_left': "Open", 'hood': "Closed"}
+
+
+@pytest.mark.parametrize('quantize, tolerance', [(False, 2e-3), (True, 2e-2)])
+def test_saved_index_keeps_distances_and_order(tmp_path, quantize, tolerance):
+    embeddings = random_unit_vectors(200, 32)
+    index = make_index(embeddings)
+    path = str(tmp_path / 'index.npz')
+
+    index.save(path, quantize=quantize)
+    loaded = EmbeddingIndex.load(path)
+
+    query = embeddings[42] + 0.3 * random_unit_vectors(1, 32, seed=2)[0]
+    original = index.search(query, k=3)
+    restored = loaded.search(query, k=3)
+    assert [neighbor['filename'] for neighbor in restored] == [neighbor['filename'] for neighbor in original]
+    np.testing.assert_allclose(
+        [neighbor['distance'] for neighbor in restored],
+        [neighbor['distance'] for neighbor in original],
+        atol=tolerance
+    )
+    assert loaded.weights_fingerprint == 'weights'
+    assert loaded.component_names == COMPONENT_NAMES
+    assert loaded.tilts.tolist() == list(range(200))
+
+
+def test_projection_is_saved_and_applied_to_queries(tmp_path):
+    features = np.random.default_rng(3).normal(size=(20, 8)).astype(np.float32)
+    mean = features.mean(axis=0)
+    projection = np.linalg.qr(np.random.default_rng(4).normal(size=(8, 8)))[0][:, :3].astype(np.float32)
+    index = make_index(np.zeros((20, 3)), mean=mean, projection=projection)
+    index.embeddings = index.project(features)
+    path = str(tmp_path / 'index.npz')
+
+    index.save(path)
+    loaded = EmbeddingIndex.load(path)
+
+    assert loaded.embeddings.shape == (20, 3)
+    assert loaded.search(features[5], k=1)[0]['filename'] == '5.png'
+
+
+def test_predictions_from_neighbor_derive_confidence_from_similarity():
+    index = make_index(random_unit_vectors(2, 4))
+    neighbor = {'filename': '1.png', 'distance': 0.1, 'labels': {'front_left': "Open", 'hood': "Closed"}}
+
+    predictions = index.predictions_from_neighbor(neighbor)
+
+    assert predictions['front_left'] == {'state': "Open", 'confidence_open': pytest.approx(0.9)}
+    assert predictions['hood'] == {'state': "Closed", 'confidence_open': pytest.approx(0.1)}
+    neighbor['distance'] = -1e-6
+    assert index.predictions_from_neighbor(neighbor)['front_left']['confidence_open'] == 1.0
+
+
+def test_weights_fingerprint_changes_with_the_file(tmp_path):
+    path = tmp_path / 'weights.pth'
+    path.write_bytes(b'first weights')
+    first_fingerprint = weights_fingerprint(str(path))
+
+    assert weights_fingerprint(str(path)) == first_fingerprint
+    path.write_bytes(b'other weights, longer')
+    assert weights_fingerprint(str(path)) != first_fingerprint
+
+
+class FakeFeatures:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeClassifier:
+    def __init__(self, features, weights_fingerprint='weights'):
+        self.features = features
+        self.weights_fingerprint = weights_fingerprint
+
+    def preprocess_image_bytes(self, image_bytes):
+        return image_bytes
+
+    def extract_features(self, image_tensor):
+        return FakeFeatures(self.features[None, :])
+
+    def predict_features(self, features):
+        return 'model prediction'
+
+
+def test_index_built_from_other_weights_is_not_used():
+    embeddings = random_unit_vectors(5, 8)
+    index = make_index(embeddings)
+    model = FakeClassifier(embeddings[2])
+
+    assert index.matches(model)
+    assert search_image_bytes(model, b'image', index, k=1)[0]['filename'] == '2.png'
+    assert predict_image_bytes_with_index(model, b'image', index, max_distance=0.01)[1] == 'index'
+
+    stale_model = FakeClassifier(embeddings[2], weights_fingerprint='retrained')
+    assert not index.matches(stale_model)
+    assert not make_index(embeddings, weights_fingerprint=None).matches(model)
+    with pytest.raises(StaleEmbeddingIndex):
+        search_image_bytes(stale_model, b'image', index)
+    assert predict_image_bytes_with_index(stale_model, b'image', index, max_distance=0.01) == \
+        ('model prediction', 'model')
+
+
+def test_fast_path_falls_back_to_the_model_beyond_max_distance():
+    embeddings = random_unit_vectors(5, 8)
+    index = make_index(embeddings)
+    query = embeddings[2] + 0.5 * random_unit_vectors(1, 8, seed=5)[0]
+
+    assert predict_image_bytes_with_index(FakeClassifier(query), b'image', index, max_distance=0.001) == \
+        ('model prediction', 'model')
@@ -0,0 +1,260 @@
+import csv
+import glob
+import json
+import os
+
+import pytest
+
+from models import image_to_text_annotations_builder as builder_module
+from models.image_to_text_annotations_builder import (
+    OUTPUT_FORMAT_PARQUET,
+    ImageToTextAnnotationsBuilder,
+    build_text_annotation,
+)
+
+
+SOURCE_HEADER = ['filename', 'front_left', 'front_right', 'rear_left', 'rear_right', 'hood']
+
+
+def write_source(path, rows):
+    with open(path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(SOURCE_HEADER)
+        writer.writerows(rows)
+
+
+def read_csv(path):
+    with open(path, mode='r', newline='', encoding='utf-8') as file:
+        return list(csv.DictReader(file))
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'annotations.csv'), str(tmp_path / 'out' / 'image_to_text_annotations.csv')
+
+
+def make_builder(paths, **kwargs):
+    source_path, output_path = paths
+    return ImageToTextAnnotationsBuilder(source_path=source_path, output_path=output_path, chunk_size=2, **kwargs)
+
+
+def test_first_build_writes_all_rows_and_manifest(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1], ['c.png', 0, 0, 0, 0, 0]])
+    builder = make_builder(paths)
+
+    assert builder.build() == 3
+
+    output = read_csv(paths[1])
+    assert [row['filename'] for row in output] == ['a.png', 'b.png', 'c.png']
+    assert output[0]['text'] == build_text_annotation({'filename': 'a.png', 'front_left': '1'})['text']
+    assert [row['filename'] for row in read_csv(builder.manifest_path)] == ['a.png', 'b.png', 'c.png']
+
+
+def test_unchanged_source_writes_nothing(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+    with open(paths[1], 'rb') as file:
+        output_before = file.read()
+
+    assert make_builder(paths).build() == 0
+    with open(paths[1], 'rb') as file:
+        assert file.read() == output_before
+
+
+def test_new_rows_are_appended(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1], ['c.png', 0, 1, 0, 0, 0]])
+    builder = make_builder(paths)
+
+    assert builder.build() == 1
+    assert [row['filename'] for row in read_csv(paths[1])] == ['a.png', 'b.png', 'c.png']
+    assert [row['filename'] for row in read_csv(builder.manifest_path)] == ['a.png', 'b.png', 'c.png']
+
+
+def test_changed_row_triggers_full_rebuild(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 0], ['c.png', 0, 1, 0, 0, 0]])
+
+    assert make_builder(paths).build() == 3
+    output = read_csv(paths[1])
+    assert [row['filename'] for row in output] == ['a.png', 'b.png', 'c.png']
+    assert output[1]['text'].endswith('and the hood is closed.')
+
+
+def test_removed_row_triggers_full_rebuild(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1], ['c.png', 0, 1, 0, 0, 0]])
+    make_builder(paths).build()
+
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['c.png', 0, 1, 0, 0, 0], ['d.png', 0, 0, 1, 0, 0]])
+    builder = make_builder(paths)
+
+    assert builder.build() == 3
+    assert [row['filename'] for row in read_csv(paths[1])] == ['a.png', 'c.png', 'd.png']
+    assert [row['filename'] for row in read_csv(builder.manifest_path)] == ['a.png', 'c.png', 'd.png']
+    assert not os.path.exists(f"{paths[1]}.tmp")
+
+
+def test_missing_output_ignores_stale_manifest(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+    os.remove(paths[1])
+
+    assert make_builder(paths).build() == 2
+    assert [row['filename'] for row in read_csv(paths[1])] == ['a.png', 'b.png']
+
+
+def test_parallel_build_keeps_source_order(paths):
+    rows = [[f"{index:03d}.png", index % 2, 0, 0, 0, 0] for index in range(25)]
+    write_source(paths[0], rows)
+
+    assert make_builder(paths, num_workers=2).build() == 25
+    assert [row['filename'] for row in read_csv(paths[1])] == [row[0] for row in rows]
+
+
+def test_csv_rows_without_manifest_rows_are_not_duplicated(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+    # An append interrupted after writing the output rows of a chunk, before its manifest rows.
+    with open(paths[1], mode='a', newline='', encoding='utf-8') as file:
+        csv.DictWriter(file, fieldnames=['filename', 'text']).writerow(
+            build_text_annotation({'filename': 'c.png', 'front_right': '1'})
+        )
+
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1], ['c.png', 0, 1, 0, 0, 0]])
+
+    assert make_builder(paths).build() == 1
+    assert [row['filename'] for row in read_csv(paths[1])] == ['a.png', 'b.png', 'c.png']
+
+
+def test_csv_output_shorter_than_manifest_triggers_full_rebuild(paths):
+    write_source(paths[0], [['a.png', 1, 0, 0, 0, 0], ['b.png', 0, 0, 0, 0, 1]])
+    make_builder(paths).build()
+    with open(paths[1], mode='w', newline='', encoding='utf-8') as file:
+        file.write('filename,text\r\n')
+
+    assert make_builder(paths).build() == 2
+    assert [row['filename'] for row in read_csv(paths[1])] == ['a.png', 'b.png']
+
+
+class FakeParquetChunkWriter:
+    """
+    Writes JSON lines instead of Parquet, the commit protocol of the builder is the same.
+    """
+
+    def __init__(self, path, fieldnames):
+        self.file = open(path, mode='w', encoding='utf-8')
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_parquet_filenames(output_dir):
+    filenames = []
+    for part_path in sorted(glob.glob(os.path.join(output_dir, 'part-*.parquet'))):
+        with open(part_path, mode='r', encoding='utf-8') as file:
+            filenames.extend(json.loads(line)['filename'] for line in file)
+    return filenames
+
+
+@pytest.fixture
+def parquet_builder(tmp_path, monkeypatch):
+    monkeypatch.setattr(builder_module, '_ParquetChunkWriter', FakeParquetChunkWriter)
+    source_path = str(tmp_path / 'annotations.csv')
+    output_dir = str(tmp_path / 'image_to_text_annotations')
+
+    def make_parquet_builder():
+        return ImageToTextAnnotationsBuilder(
+            source_path=source_path,
+            output_path=output_dir,
+            output_format=OUTPUT_FORMAT_PARQUET,
+            chunk_size=2
+        )
+
+    return source_path, output_dir, make_parquet_builder
+
+
+def source_rows(count):
+    return [[f"{index}.png", index % 2, 0, 0, 0, 0] for index in range(count)]
+
+
+def test_interrupted_parquet_append_keeps_no_rows_in_manifest(parquet_builder, monkeypatch):
+    source_path, output_dir, make_parquet_builder = parquet_builder
+    write_source(source_path, source_rows(2))
+    make_parquet_builder().build()
+
+    write_source(source_path, source_rows(8))
+    build_chunk = builder_module.build_text_annotations_chunk
+    calls = []
+
+    def failing_build_chunk(rows):
+        calls.append(rows)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return build_chunk(rows)
+
+    monkeypatch.setattr(builder_module, 'build_text_annotations_chunk', failing_build_chunk)
+    builder = make_parquet_builder()
+    with pytest.raises(KeyboardInterrupt):
+        builder.build()
+
+    assert [row['filename'] for row in read_csv(builder.manifest_path)] == ['0.png', '1.png']
+    assert read_parquet_filenames(output_dir) == ['0.png', '1.png']
+
+    monkeypatch.setattr(builder_module, 'build_text_annotations_chunk', build_chunk)
+    assert make_parquet_builder().build() == 6
+    assert read_parquet_filenames(output_dir) == [f"{index}.png" for index in range(8)]
+    assert glob.glob(f"{builder.manifest_path}*.pending") == []
+
+
+def test_parquet_append_interrupted_after_commit_recovers_manifest(parquet_builder, monkeypatch):
+    source_path, output_dir, make_parquet_builder = parquet_builder
+    write_source(source_path, source_rows(2))
+    make_parquet_builder().build()
+
+    write_source(source_path, source_rows(4))
+
+    def interrupted_merge(self, pending_manifest_path):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ImageToTextAnnotationsBuilder, '_merge_pending_manifest', interrupted_merge)
+        with pytest.raises(KeyboardInterrupt):
+            make_parquet_builder().build()
+
+    builder = make_parquet_builder()
+    assert builder.build() == 0
+    assert read_parquet_filenames(output_dir) == ['0.png', '1.png', '2.png', '3.png']
+    assert [row['filename'] for row in read_csv(builder.manifest_path)] == ['0.png', '1.png', '2.png', '3.png']
+
+
+def test_parquet_output_path_defaults_to_a_directory():
+    builder = ImageToTextAnnotationsBuilder(output_format=OUTPUT_FORMAT_PARQUET)
+
+    assert builder.output_csv_path == 'datasets/image_to_text_annotations'
+    assert builder.manifest_path == 'datasets/image_to_text_annotations.manifest.csv'
+
+
+def test_parquet_csv_output_path_is_replaced_by_a_directory(tmp_path):
+    csv_output_path = tmp_path / 'image_to_text_annotations.csv'
+    csv_output_path.write_text('filename,text\n')
+
+    builder = ImageToTextAnnotationsBuilder(output_path=str(csv_output_path), output_format=OUTPUT_FORMAT_PARQUET)
+
+    assert builder.output_csv_path == str(tmp_path / 'image_to_text_annotations')
+
+
+def test_parquet_output_path_cannot_be_a_file(tmp_path):
+    file_path = tmp_path / 'image_to_text_annotations'
+    file_path.write_text('')
+
+    with pytest.raises(ValueError):
+        ImageToTextAnnotationsBuilder(output_path=str(file_path), output_format=OUTPUT_FORMAT_PARQUET)
@@ -0,0 +1,242 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('torch')
+
+from models.model_manager import MODEL_STATE_LOADED, MODEL_STATE_UNLOADED, ModelManager  # noqa: E402
+
+
+MB = 1024 * 1024
+
+
+class MemoryTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current_bytes = 0
+        self.peak_bytes = 0
+
+    def allocate(self, size_bytes):
+        with self.lock:
+            self.current_bytes += size_bytes
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes)
+
+    def free(self, size_bytes):
+        with self.lock:
+            self.current_bytes -= size_bytes
+
+
+class FakeModel:
+    def __init__(self, size_mb, memory=None, load_seconds=0.0, fail_loads=0):
+        self.size_bytes = size_mb * MB
+        self.memory = memory or MemoryTracker()
+        self.load_seconds = load_seconds
+        self.fail_loads = fail_loads
+        self.loaded = False
+        self.load_count = 0
+        self.unload_count = 0
+        self.loads_started = threading.Event()
+
+    def load_model(self):
+        self.loads_started.set()
+        # The memory is allocated from the start of the load, like the real checkpoints.
+        self.memory.allocate(self.size_bytes)
+        time.sleep(self.load_seconds)
+        if self.fail_loads:
+            self.fail_loads -= 1
+            self.memory.free(self.size_bytes)
+            raise RuntimeError("load failed")
+        self.loaded = True
+        self.load_count += 1
+
+    def unload_model(self):
+        if self.loaded:
+            self.memory.free(self.size_bytes)
+        self.loaded = False
+        self.unload_count += 1
+
+    def resident_bytes(self):
+        return self.size_bytes if self.loaded else 0
+
+
+def make_manager(memory_budget_mb=100):
+    return ModelManager(memory_budget_mb=memory_budget_mb, idle_unload_seconds=60, sweep_interval_seconds=60)
+
+
+def use(manager, name, hold_seconds=0.0):
+    with manager.acquire(name) as model:
+        assert model.loaded
+        time.sleep(hold_seconds)
+
+
+def run_in_threads(*targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+
+
+def test_model_is_loaded_on_first_use_and_reused():
+    manager = make_manager()
+    model = FakeModel(10)
+    manager.register('a', model)
+
+    use(manager, 'a')
+    use(manager, 'a')
+
+    assert model.load_count == 1
+    assert manager.report()['models']['a']['state'] == MODEL_STATE_LOADED
+    assert manager.report()['models']['a']['in_use'] == 0
+
+
+def test_concurrent_callers_wait_for_a_single_load():
+    manager = make_manager()
+    model = FakeModel(10, load_seconds=0.2)
+    manager.register('a', model)
+
+    run_in_threads(*[lambda: use(manager, 'a') for _ in range(4)])
+
+    assert model.load_count == 1
+
+
+def test_loading_model_does_not_block_other_models():
+    manager = make_manager()
+    slow_model = FakeModel(10, load_seconds=0.5)
+    manager.register('slow', slow_model)
+    manager.register('fast', FakeModel(10))
+
+    slow_thread = threading.Thread(target=use, args=(manager, 'slow'))
+    slow_thread.start()
+    assert slow_model.loads_started.wait(timeout=5)
+
+    start_time = time.monotonic()
+    use(manager, 'fast')
+    report = manager.report()
+    assert time.monotonic() - start_time < 0.25
+    assert report['models']['slow']['state'] == 'loading'
+
+    slow_thread.join(timeout=5)
+
+
+def test_least_recently_used_idle_model_is_evicted_first():
+    manager = make_manager(memory_budget_mb=100)
+    models = {name: FakeModel(40) for name in ('a', 'b', 'c')}
+    for name, model in models.items():
+        manager.register(name, model)
+
+    use(manager, 'a')
+    use(manager, 'b')
+    use(manager, 'a')
+    use(manager, 'c')
+
+    assert not models['b'].loaded
+    assert models['a'].loaded and models['c'].loaded
+
+
+def test_pinned_model_is_not_evicted():
+    manager = make_manager(memory_budget_mb=100)
+    memory = MemoryTracker()
+    pinned_model = FakeModel(80, memory)
+    manager.register('pinned', pinned_model)
+    manager.register('other', FakeModel(80, memory), size_hint_mb=80)
+
+    with manager.acquire('pinned'):
+        other_thread = threading.Thread(target=use, args=(manager, 'other'))
+        other_thread.start()
+        time.sleep(0.2)
+        # The other load waits for the pinned model instead of exceeding the budget.
+        assert pinned_model.loaded
+        assert manager.report()['models']['other']['state'] == MODEL_STATE_UNLOADED
+
+    other_thread.join(timeout=5)
+    assert not other_thread.is_alive()
+    assert not pinned_model.loaded
+    assert memory.peak_bytes <= 100 * MB
+
+
+def test_concurrent_loads_stay_within_the_budget():
+    manager = make_manager(memory_budget_mb=100)
+    memory = MemoryTracker()
+    manager.register('a', FakeModel(80, memory, load_seconds=0.2), size_hint_mb=80)
+    manager.register('b', FakeModel(80, memory, load_seconds=0.2), size_hint_mb=80)
+
+    run_in_threads(lambda: use(manager, 'a', 0.1), lambda: use(manager, 'b', 0.1))
+
+    assert memory.peak_bytes <= 100 * MB
+
+
+def test_first_load_reserves_its_size_hint():
+    manager = make_manager(memory_budget_mb=100)
+    memory = MemoryTracker()
+    idle_model = FakeModel(60, memory)
+    manager.register('idle', idle_model)
+    manager.register('new', FakeModel(60, memory), size_hint_mb=60)
+
+    use(manager, 'idle')
+    use(manager, 'new')
+
+    # The idle model was evicted before the load started, not after it.
+    assert not idle_model.loaded
+    assert memory.peak_bytes == 60 * MB
+
+
+def test_model_larger_than_the_budget_is_loaded_alone():
+    manager = make_manager(memory_budget_mb=100)
+    small_model = FakeModel(10)
+    manager.register('small', small_model)
+    manager.register('large', FakeModel(150), size_hint_mb=150)
+
+    use(manager, 'small')
+    use(manager, 'large')
+
+    assert not small_model.loaded
+    assert manager.report()['models']['large']['state'] == MODEL_STATE_LOADED
+
+
+def test_failed_load_is_retried_by_the_next_caller():
+    manager = make_manager()
+    model = FakeModel(10, fail_loads=1)
+    manager.register('a', model)
+
+    with pytest.raises(RuntimeError):
+        use(manager, 'a')
+    assert manager.report()['models']['a'] == {
+        'state': MODEL_STATE_UNLOADED,
+        'in_use': 0,
+        'resident_mb': 0.0,
+        'idle_seconds': manager.report()['models']['a']['idle_seconds'],
+        'load_count': 0,
+    }
+
+    use(manager, 'a')
+    assert model.load_count == 1
+
+
+def test_sweep_unloads_idle_models_only():
+    manager = ModelManager(memory_budget_mb=100, idle_unload_seconds=0.01, sweep_interval_seconds=60)
+    idle_model = FakeModel(10)
+    busy_model = FakeModel(10)
+    manager.register('idle', idle_model)
+    manager.register('busy', busy_model)
+
+    use(manager, 'idle')
+    with manager.acquire('busy'):
+        time.sleep(0.05)
+        manager.sweep_idle()
+
+    assert not idle_model.loaded
+    assert busy_model.loaded
+
+
+def test_fits_in_budget_uses_loaded_and_expected_sizes():
+    manager = make_manager(memory_budget_mb=100)
+    manager.register('a', FakeModel(30), size_hint_mb=50)
+    manager.register('b', FakeModel(60), size_hint_mb=60)
+
+    assert not manager.fits_in_budget(['a', 'b'])
+    use(manager, 'a')
+    assert manager.is_loaded('a')
+    assert manager.fits_in_budget(['a', 'b'])
@@ -0,0 +1,167 @@
+import io
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+from models.video_timeline import SAMPLING_SCENE, ComponentStateTimeline, VideoTimelineBuilder
+
+
+COMPONENT_NAMES = ['front_left', 'hood']
+
+
+def run_timeline(probabilities_by_frame, min_consecutive=1, threshold=0.5):
+    timeline = ComponentStateTimeline(COMPONENT_NAMES, threshold=threshold, min_consecutive=min_consecutive)
+    for frame_index, probabilities in enumerate(probabilities_by_frame):
+        timeline.update(frame_index * 0.5, frame_index, probabilities)
+    return timeline.to_dict()
+
+
+def changes(result):
+    return [(event['timestamp'], event['component'], event['from'], event['to']) for event in result['events']]
+
+
+def test_first_frame_sets_the_initial_state():
+    result = run_timeline([[0.9, 0.1], [0.8, 0.2]])
+
+    assert result['initial_state'] == {
+        'front_left': {'state': "Open", 'confidence_open': 0.9},
+        'hood': {'state': "Closed", 'confidence_open': 0.1},
+    }
+    assert result['events'] == []
+    assert result['final_state'] == {'front_left': "Open", 'hood': "Closed"}
+    assert result['frames_sampled'] == 2
+    assert result['duration'] == 0.5
+
+
+def test_probability_at_threshold_is_closed():
+    result = run_timeline([[0.5, 0.51]])
+
+    assert result['final_state'] == {'front_left': "Closed", 'hood': "Open"}
+
+
+def test_change_is_reported_at_the_frame_it_happens():
+    result = run_timeline([[0.1, 0.1], [0.1, 0.1], [0.7, 0.1]])
+
+    assert result['events'] == [{
+        'timestamp': 1.0,
+        'frame_index': 2,
+        'component': 'front_left',
+        'from': "Closed",
+        'to': "Open",
+        'confidence_open': 0.7,
+    }]
+
+
+def test_flicker_shorter_than_min_consecutive_is_ignored():
+    result = run_timeline([[0.1, 0.1], [0.9, 0.1], [0.9, 0.1], [0.1, 0.1], [0.1, 0.1]], min_consecutive=3)
+
+    assert result['events'] == []
+    assert result['final_state']['front_left'] == "Closed"
+
+
+def test_debounced_change_is_timestamped_at_its_first_frame():
+    result = run_timeline([[0.1, 0.1], [0.6, 0.1], [0.8, 0.1], [0.9, 0.1]], min_consecutive=3)
+
+    assert changes(result) == [(0.5, 'front_left', "Closed", "Open")]
+    assert result['events'][0]['frame_index'] == 1
+    assert result['events'][0]['confidence_open'] == 0.6
+
+
+def test_interrupted_run_restarts_the_debounce():
+    result = run_timeline(
+        [[0.1, 0.1], [0.9, 0.1], [0.9, 0.1], [0.1, 0.1], [0.9, 0.1], [0.9, 0.1]],
+        min_consecutive=3
+    )
+
+    assert result['events'] == []
+
+
+def test_revert_is_reported_as_a_second_event():
+    result = run_timeline([[0.1, 0.1], [0.9, 0.1], [0.9, 0.1], [0.2, 0.1], [0.2, 0.1]], min_consecutive=2)
+
+    assert changes(result) == [
+        (0.5, 'front_left', "Closed", "Open"),
+        (1.5, 'front_left', "Open", "Closed"),
+    ]
+    assert result['final_state']['front_left'] == "Closed"
+
+
+def test_events_are_ordered_by_timestamp_then_component():
+    result = run_timeline([[0.1, 0.1], [0.1, 0.9], [0.9, 0.9], [0.9, 0.9]], min_consecutive=2)
+
+    assert changes(result) == [
+        (0.5, 'hood', "Closed", "Open"),
+        (1.0, 'front_left', "Closed", "Open"),
+    ]
+
+
+def make_animated_gif(colors, duration_ms=100):
+    frames = [Image.new('RGB', (16, 16), color) for color in colors]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:], duration=duration_ms, loop=0)
+    buffer.seek(0)
+    return buffer
+
+
+class FakePredictor:
+    """
+    Predicts `front_left` open for red frames and `hood` open for blue frames.
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def submit_batch(self, images):
+        self.batch_sizes.append(len(images))
+        future = Future()
+        future.set_result([
+            [1.0 if red > 128 else 0.0, 1.0 if blue > 128 else 0.0]
+            for red, _, blue in (image.getpixel((0, 0)) for image in images)
+        ])
+        return future
+
+
+RED, DARK_RED, BLUE, DARK_BLUE = (250, 0, 0), (235, 0, 0), (0, 0, 250), (0, 0, 235)
+
+
+def test_builder_samples_gif_frames_at_the_requested_rate():
+    predictor = FakePredictor()
+    builder = VideoTimelineBuilder(predictor.submit_batch, COMPONENT_NAMES, fps=5, batch_size=2, frame_size=(8, 8))
+
+    result = builder.build(make_animated_gif([RED, DARK_RED, BLUE, DARK_BLUE, RED, DARK_RED]), filename='clip.gif')
+
+    # Frames every 0.1s sampled every 0.2s: frames 0, 2 and 4.
+    assert result['frames_sampled'] == 3
+    assert predictor.batch_sizes == [2, 1]
+    assert changes(result) == [
+        (0.2, 'front_left', "Open", "Closed"),
+        (0.2, 'hood', "Closed", "Open"),
+        (0.4, 'front_left', "Closed", "Open"),
+        (0.4, 'hood', "Open", "Closed"),
+    ]
+
+
+def test_builder_scene_sampling_keeps_changed_frames_only():
+    predictor = FakePredictor()
+    builder = VideoTimelineBuilder(predictor.submit_batch, COMPONENT_NAMES, sampling=SAMPLING_SCENE, frame_size=(8, 8))
+
+    result = builder.build(make_animated_gif([RED, DARK_RED, BLUE, DARK_BLUE, RED]), filename='clip.gif')
+
+    assert result['frames_sampled'] == 3
+    assert [event['frame_index'] for event in result['events']] == [2, 2, 4, 4]
+
+
+def test_builder_rejects_invalid_images():
+    builder = VideoTimelineBuilder(FakePredictor().submit_batch, COMPONENT_NAMES)
+
+    with pytest.raises(ValueError):
+        builder.build(io.BytesIO(b'not an image'), filename='clip.gif')
+
+
+def test_builder_rejects_truncated_gif():
+    gif_bytes = make_animated_gif([RED, BLUE, RED, BLUE]).getvalue()
+    builder = VideoTimelineBuilder(FakePredictor().submit_batch, COMPONENT_NAMES, fps=100)
+
+    with pytest.raises(ValueError):
+        builder.build(io.BytesIO(gif_bytes[:len(gif_bytes) // 2]), filename='clip.gif')